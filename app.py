@@ -3,27 +3,43 @@
 # ==========================
 import re
 import pdfplumber
+from pdfplumber.page import Page
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdftypes import resolve1
 import json
-from collections import defaultdict
+from collections import defaultdict, deque
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 import random
-from flask import Flask, request, jsonify, send_file, render_template
+from flask import Flask, Response, request, jsonify, send_file, render_template, stream_with_context, has_request_context
 from flask_cors import CORS
-import io
 from reportlab.lib.units import inch
 import os
 import json
 import sys
 import time
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
 from pymongo.errors import ConnectionFailure
 from datetime import datetime
 from bson import ObjectId
 from werkzeug.security import generate_password_hash, check_password_hash
 from bson import ObjectId
 import hashlib
+import threading
+import queue
+import tempfile
+import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pymongo.errors import BulkWriteError, DuplicateKeyError
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    import pymupdf  # PyMuPDF: une los PDF renderizados en paralelo
+except ImportError:
+    pymupdf = None
 
 # ==========================
 # RUTAS
@@ -32,11 +48,18 @@ json_dir = "./jsons"
 winners_dir = "./winners"
 upload_dir = "./upload"
 
+# ==========================
+# MOTOR DEL JUEGO
+# ==========================
+# "python" (máscaras de bits + índice invertido) o "numpy" (vectorizado, eventos grandes)
+MOTOR_JUEGO = os.environ.get("BINGO_MOTOR", "python")
+
 # ==========================
 # Conexión a MongoDB
 # ==========================
-mongo_client = MongoClient("mongodb://localhost:27017/")
-mongo_db = mongo_client["bingo_db"]
+# BINGO_DB permite usar otra base (p. ej. scripts/bench_juego.py usa una propia)
+mongo_client = MongoClient(os.environ.get("BINGO_MONGO_URI", "mongodb://localhost:27017/"))
+mongo_db = mongo_client[os.environ.get("BINGO_DB", "bingo_db")]
 mongo_collection_winners = mongo_db["tablas_ganadoras"]
 mongo_collection_tables = mongo_db["tablas"]
 mongo_collection_students = mongo_db["Estudiantes"]
@@ -69,34 +92,437 @@ def generate_bingo_card():
     card[2][2] = None  # centro libre
     return card
 
+# --- Firma de un cartón: sus 24 números (sin el centro) como 24 bytes ---
+# Se guarda en `tablas.firma` con índice único: el mismo cartón no puede existir
+# dos veces en la base aunque tenga otro serial.
+def firma_carton(matrix):
+    """Firma del cartón, o None si no tiene 24 números válidos (p. ej. un PDF mal leído)."""
+    try:
+        numeros = [matrix[k // 5][k % 5] for k in CASILLAS_SIN_CENTRO]
+    except (IndexError, KeyError, TypeError):
+        return None
+    if not all(isinstance(n, int) and not isinstance(n, bool) and 0 < n < 256 for n in numeros):
+        return None
+    return bytes(numeros)
+
+
+def firmas_cartones(matrices):
+    """
+    Firmas de un arreglo (N, 5, 5) de una sola vez, vistas como un valor de ancho
+    fijo para comparar/ordenar sin tuplas. f.tobytes() == firma_carton(matrix).
+    """
+    numeros = np.ascontiguousarray(matrices.reshape(len(matrices), 25)[:, CASILLAS_SIN_CENTRO], dtype=np.uint8)
+    return numeros.view(np.dtype((np.void, 24))).ravel()
+
+
+def firmas_en_bd(firmas):
+    """{firma: serial} de las firmas que ya están en `tablas` (una sola consulta $in al índice)."""
+    if not firmas:
+        return {}
+    asegurar_indice_firmas()
+    return {
+        doc["firma"]: doc.get("serial")
+        for doc in mongo_collection_tables.find({"firma": {"$in": list(firmas)}}, {"_id": 0, "firma": 1, "serial": 1})
+    }
+
+
+_indice_firmas_listo = False
+
+
+def asegurar_indice_firmas():
+    """Crea el índice único de firmas y completa la firma de las tablas antiguas (una vez por proceso)."""
+    global _indice_firmas_listo
+    if _indice_firmas_listo:
+        return
+    _indice_firmas_listo = True
+    try:
+        # sparse: las tablas sin firma (matriz incompleta) no chocan entre sí
+        mongo_collection_tables.create_index("firma", unique=True, sparse=True)
+        # Se recorre el cursor por lotes: en memoria solo hay MONGO_LOTE_TABLAS operaciones
+        def operaciones():
+            for doc in mongo_collection_tables.find({"firma": {"$exists": False}}, {"matrix": 1}):
+                firma = firma_carton(doc.get("matrix"))
+                if firma is not None:
+                    yield UpdateOne({"_id": doc["_id"]}, {"$set": {"firma": firma}})
+
+        agregadas = repetidas = 0
+        for grupo in en_lotes(operaciones(), MONGO_LOTE_TABLAS):
+            try:
+                agregadas += mongo_collection_tables.bulk_write(grupo, ordered=False).modified_count
+            except BulkWriteError as e:
+                agregadas += e.details.get("nModified", 0)
+                repetidas += len(e.details.get("writeErrors", []))
+        if agregadas:
+            print(f"✅ Firma agregada a {agregadas} tablas existentes.")
+        if repetidas:
+            print(f"⚠️ {repetidas} tablas repiten la matriz de otra y quedaron sin firma.")
+    except Exception as e:
+        _indice_firmas_listo = False
+        print(f"❌ No se pudo preparar el índice de firmas: {e}")
+
+
+# Operaciones por cada bulk_write al guardar tablas generadas o subidas
+MONGO_LOTE_TABLAS = int(os.environ.get("BINGO_MONGO_LOTE", 1000))
+
+
+def guardar_tablas_mongo(cambios, lote=MONGO_LOTE_TABLAS):
+    """
+    Upsert por serial de muchas tablas: cambios es un iterable de (serial, update)
+    y se envía en lotes de bulk_write(ordered=False), un viaje a la base por lote.
+    Un cartón que falla (p. ej. firma repetida) no detiene al resto.
+    Devuelve {"insertados", "actualizados", "fallidos"}.
+    """
+    resumen = {"insertados": 0, "actualizados": 0, "fallidos": 0}
+
+    def enviar(seriales, operaciones):
+        try:
+            resultado = mongo_collection_tables.bulk_write(operaciones, ordered=False)
+            resumen["insertados"] += resultado.upserted_count
+            resumen["actualizados"] += resultado.modified_count
+        except BulkWriteError as e:
+            errores = e.details.get("writeErrors", [])
+            resumen["insertados"] += e.details.get("nUpserted", 0)
+            resumen["actualizados"] += e.details.get("nModified", 0)
+            resumen["fallidos"] += len(errores)
+            print(f"❌ Error guardando seriales {[seriales[err['index']] for err in errores]}: "
+                  f"{errores[0].get('errmsg') if errores else e}")
+        except Exception as e:
+            resumen["fallidos"] += len(operaciones)
+            print(f"❌ Error guardando {len(operaciones)} tablas ({seriales[0]}..{seriales[-1]}): {e}")
+
+    for grupo in en_lotes(cambios, lote):
+        enviar([serial for serial, _ in grupo],
+               [UpdateOne({"serial": serial}, cambio, upsert=True) for serial, cambio in grupo])
+    return resumen
+
+
+def en_lotes(iterable, tamano):
+    """Agrupa un iterable (p. ej. un generador) en listas de hasta `tamano` elementos."""
+    lote = []
+    for elemento in iterable:
+        lote.append(elemento)
+        if len(lote) >= tamano:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def generar_matrices_lote(cantidad, rng):
+    """(cantidad, 5, 5) uint8: cada columna son 5 números distintos de su rango B-I-N-G-O, centro en 0."""
+    matrices = np.empty((cantidad, 5, 5), dtype=np.uint8)
+    base = np.tile(np.arange(15, dtype=np.uint8), (cantidad, 1))
+    for col in range(5):
+        matrices[:, :, col] = rng.permuted(base, axis=1)[:, :5] + (1 + 15 * col)
+    matrices[:, 2, 2] = 0
+    return matrices
+
+
+def generar_cartones_unicos(cantidad, semilla=None, firmas_ocupadas=None):
+    """
+    Matrices (listas con el centro en None) sin repetidos; solo se regeneran las filas
+    que chocan. firmas_ocupadas(firmas) -> firmas ya usadas fuera del lote (p. ej. firmas_en_bd).
+    """
+    if np is None:
+        cards, generated = [], set()
+        while len(cards) < cantidad:
+            lote = []
+            while len(cards) + len(lote) < cantidad:
+                card = generate_bingo_card()
+                signature = tuple(tuple(row) for row in card)
+                if signature not in generated:
+                    generated.add(signature)
+                    lote.append(card)
+            if firmas_ocupadas is not None:
+                # Los que ya existen fuera del lote se descartan y se reponen en la siguiente vuelta
+                ocupadas = firmas_ocupadas([firma_carton(card) for card in lote])
+                lote = [card for card in lote if firma_carton(card) not in ocupadas]
+            cards += lote
+        return cards
+    cantidad = max(cantidad, 0)
+    rng = np.random.default_rng(semilla)
+    matrices = generar_matrices_lote(cantidad, rng)
+    por_revisar = np.arange(cantidad)
+    while True:
+        # Se conserva la primera aparición de cada firma y se rehacen las demás
+        firmas = firmas_cartones(matrices)
+        _, primeras = np.unique(firmas, return_index=True)
+        repetidas = np.ones(cantidad, dtype=bool)
+        repetidas[primeras] = False
+        if firmas_ocupadas is not None and len(por_revisar):
+            # Solo las filas nuevas se consultan fuera del lote
+            ocupadas = firmas_ocupadas([firmas[i].tobytes() for i in por_revisar])
+            for i in por_revisar:
+                if firmas[i].tobytes() in ocupadas:
+                    repetidas[i] = True
+        if not repetidas.any():
+            break
+        por_revisar = np.flatnonzero(repetidas)
+        matrices[por_revisar] = generar_matrices_lote(len(por_revisar), rng)
+    cards = matrices.tolist()
+    for card in cards:
+        card[2][2] = None
+    return cards
+
 # --- Valida que no exista tablas duplicadas---
 def validar_duplicados(cards_data):
-    total_cards = len(cards_data)
-    matrices_as_tuples = [tuple(tuple(row) for row in card["matrix"]) for card in cards_data]
-    unique_matrices = set(matrices_as_tuples)
-    duplicates = total_cards - len(unique_matrices)
-    matrix_to_serials = defaultdict(list)
+    conteo = ConteoDuplicados()
     for card in cards_data:
-        key = tuple(tuple(row) for row in card["matrix"])
-        matrix_to_serials[key].append(card["serial"])
-    duplicated_serials = {key: serials for key, serials in matrix_to_serials.items() if len(serials) > 1}
-    return {
-        "total": total_cards,
-        "unicos": len(unique_matrices),
-        "duplicados": duplicates,
-        "duplicados_seriales": duplicated_serials
-    }
+        conteo.agregar(card)
+    return conteo.resumen()
 
-# --- Obtiene la infromacion del json generado ---
-def get_current_cards():
-    files = [f for f in os.listdir(json_dir) if f.endswith('.json')]
-    if not files:
-        return []
-    # Ordenar por fecha de modificación descendente
-    files.sort(key=lambda f: os.path.getmtime(os.path.join(json_dir, f)), reverse=True)
-    with open(os.path.join(json_dir, files[0]), "r", encoding="utf-8") as f:
-        return json.load(f)
-    
+
+class ConteoDuplicados:
+    """
+    validar_duplicados cartón a cartón (p. ej. mientras se lee un PDF): de cada
+    matriz vista solo recuerda su firma y el primer serial.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.primeros = {}
+        self.repetidos = {}
+
+    def agregar(self, card):
+        self.total += 1
+        matrix = card["matrix"]
+        clave = firma_carton(matrix) or tuple(tuple(row) for row in matrix)
+        if clave in self.primeros:
+            matriz = tuple(tuple(row) for row in matrix)
+            self.repetidos.setdefault(matriz, [self.primeros[clave]]).append(card["serial"])
+        else:
+            self.primeros[clave] = card["serial"]
+
+    def resumen(self):
+        return {
+            "total": self.total,
+            "unicos": len(self.primeros),
+            "duplicados": self.total - len(self.primeros),
+            "duplicados_seriales": self.repetidos
+        }
+
+# --- JSON de cartones de cada juego (sesión) ---
+# Cada juego activo guarda sus cartones en jsons/bingo_cards_active_<game_id>_<ts>.json.
+# Los archivos antiguos bingo_cards_active_<ts>.json pertenecen al juego principal.
+JUEGO_PRINCIPAL = "principal"
+GAME_ID_VALIDO = re.compile(r"^[A-Za-z0-9_-]{1,40}$")
+ARCHIVO_JUEGO = re.compile(r"^bingo_cards_active_(?:(?P<game_id>[A-Za-z0-9_-]+)_)?(?P<ts>\d+)\.json$")
+
+
+def ruta_json_juego(game_id, ts=None):
+    ts = int(time.time()) if ts is None else ts
+    return os.path.join(json_dir, f"bingo_cards_active_{game_id}_{ts}.json")
+
+
+def buscar_jsons_juegos(directorio=None):
+    """JSON más reciente de cada juego: {game_id: ruta}. Solo se recorre al arrancar."""
+    directorio = directorio or json_dir
+    if not os.path.isdir(directorio):
+        return {}
+    encontrados = {}
+    for nombre in os.listdir(directorio):
+        m = ARCHIVO_JUEGO.match(nombre)
+        if not m:
+            continue
+        game_id = m.group("game_id") or JUEGO_PRINCIPAL
+        ts = int(m.group("ts"))
+        if game_id not in encontrados or ts > encontrados[game_id][0]:
+            encontrados[game_id] = (ts, os.path.join(directorio, nombre))
+    return {game_id: ruta for game_id, (ts, ruta) in encontrados.items()}
+
+
+# --- Formato binario de cartones (<juego>.cartones.npy) ---
+# Un registro de ancho fijo por cartón: serial + los 24 números sin la casilla
+# central (0 = casilla sin número). Se abre con np.load(mmap_mode="r"), sin parsear.
+DTYPE_CARTON = np.dtype([("serial", "S24"), ("numeros", "u1", (24,))]) if np is not None else None
+CASILLAS_SIN_CENTRO = [k for k in range(25) if k != 12]
+
+
+def ruta_binaria(json_path):
+    return os.path.splitext(json_path)[0] + ".cartones.npy"
+
+
+def registro_carton(card):
+    """Registro DTYPE_CARTON (48 bytes) de un cartón para el .cartones.npy; None si no cabe en el formato."""
+    try:
+        serial = str(card["serial"]).encode("utf-8")
+        if len(serial) > DTYPE_CARTON["serial"].itemsize:
+            return None
+        numeros = [card["matrix"][k // 5][k % 5] for k in CASILLAS_SIN_CENTRO]
+    except (KeyError, IndexError, TypeError):
+        return None
+    if not all(n is None or (numero_valido(n) and not isinstance(n, bool)) for n in numeros):
+        return None
+    return serial.ljust(DTYPE_CARTON["serial"].itemsize, b"\0") + bytes(0 if n is None else n for n in numeros)
+
+
+class EscritorCartonesBinario:
+    """
+    Escribe el .cartones.npy de un JSON cartón a cartón: cada registro va a un
+    archivo crudo en disco y al cerrar se le antepone la cabecera .npy, así que la
+    memoria no depende de la cantidad de cartones.
+    """
+
+    def __init__(self, json_path):
+        self.path = ruta_binaria(json_path)
+        self.crudo_path = self.path + ".crudo"
+        self.crudo = open(self.crudo_path, "wb")
+        self.total = 0
+        self.valido = True
+
+    def agregar(self, card):
+        if not self.valido:
+            return
+        registro = registro_carton(card)
+        if registro is None:
+            self.valido = False
+            return
+        self.crudo.write(registro)
+        self.total += 1
+
+    def cerrar(self):
+        """Deja el .cartones.npy en su ruta; None si algún cartón no cabía en el formato."""
+        self.crudo.close()
+        try:
+            if not self.valido:
+                return None
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "wb") as f, open(self.crudo_path, "rb") as crudo:
+                np.lib.format.write_array_header_1_0(f, {
+                    "descr": np.lib.format.dtype_to_descr(DTYPE_CARTON),
+                    "fortran_order": False,
+                    "shape": (self.total,)
+                })
+                shutil.copyfileobj(crudo, f)
+            os.replace(tmp_path, self.path)
+            return self.path
+        finally:
+            os.remove(self.crudo_path)
+
+
+def guardar_cartones_binario(json_path, cards):
+    """Escribe el .cartones.npy del JSON; None si NumPy falta o algún cartón no cabe en el formato."""
+    if np is None:
+        return None
+    escritor = EscritorCartonesBinario(json_path)
+    try:
+        for card in cards:
+            escritor.agregar(card)
+            if not escritor.valido:
+                break
+    except Exception:
+        escritor.valido = False
+        escritor.cerrar()
+        raise
+    return escritor.cerrar()
+
+
+class CartonesBinarios:
+    """
+    Vista de solo lectura sobre los registros mapeados en memoria. Se comporta como
+    la lista de cartones del JSON: cada acceso arma {"serial", "matrix"} al vuelo.
+    """
+
+    def __init__(self, registros):
+        self.registros = registros
+
+    @classmethod
+    def abrir(cls, path):
+        return cls(np.load(path, mmap_mode="r"))
+
+    def __len__(self):
+        return len(self.registros)
+
+    def __getitem__(self, i):
+        registro = self.registros[i]
+        numeros = [n or None for n in registro["numeros"].tolist()]
+        numeros.insert(12, None)
+        return {
+            "serial": registro["serial"].decode("utf-8"),
+            "matrix": [numeros[r * 5:r * 5 + 5] for r in range(5)]
+        }
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def seriales(self):
+        return [s.decode("utf-8") for s in self.registros["serial"].tolist()]
+
+    def matrices(self):
+        """(N, 25) uint8 con la casilla central en 0."""
+        return np.insert(np.asarray(self.registros["numeros"]), 12, 0, axis=1)
+
+
+class CacheCartones:
+    """
+    Cartones de cada JSON leídos una sola vez. La entrada vale mientras el archivo
+    conserve (mtime, tamaño); /reset, /generate y /upload la reemplazan al escribir.
+    La versión de cada contenido (parte del ETag de los clientes) se deriva del archivo
+    y de esa clave, así que no se repite con otros cartones tras reiniciar el servidor.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entradas = {}
+
+    @staticmethod
+    def version_de(path, clave):
+        firma = f"{os.path.basename(path)}:{clave[0]}:{clave[1]}"
+        return hashlib.sha1(firma.encode("utf-8")).hexdigest()[:16]
+
+    def _clave(self, path):
+        estado = os.stat(path)
+        return estado.st_mtime_ns, estado.st_size
+
+    def leer(self, path):
+        """
+        (cartones, versión) del JSON; solo se lee si cambió desde la última vez.
+        Si tiene su .cartones.npy al día se mapea en memoria en lugar de parsear el JSON.
+        """
+        path = os.path.abspath(path)
+        clave = self._clave(path)
+        with self.lock:
+            entrada = self.entradas.get(path)
+            if entrada and entrada[0] == clave:
+                return entrada[1], entrada[2]
+        binario = ruta_binaria(path)
+        if np is not None and os.path.exists(binario) and os.stat(binario).st_mtime_ns >= clave[0]:
+            cards = CartonesBinarios.abrir(binario)
+        else:
+            with open(path, "r", encoding="utf-8") as f:
+                cards = json.load(f)
+        version = self.version_de(path, clave)
+        with self.lock:
+            self.entradas[path] = (clave, cards, version)
+        return cards, version
+
+    def guardar(self, path, cards):
+        """Escribe el JSON (y su .cartones.npy) y deja su contenido en caché con una versión nueva."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(cards, f, indent=2, ensure_ascii=False)
+        try:
+            if not guardar_cartones_binario(path, cards) and os.path.exists(ruta_binaria(path)):
+                # Uno viejo con la misma ruta ya no corresponde al JSON
+                os.remove(ruta_binaria(path))
+        except Exception as e:
+            print(f"⚠️ No se pudo escribir el formato binario de {path}: {e}")
+        clave = self._clave(path)
+        version = self.version_de(path, clave)
+        with self.lock:
+            self.entradas[os.path.abspath(path)] = (clave, cards, version)
+        return version
+
+    def invalidar(self, path=None):
+        """Suelta los cartones en caché de path (o de todos), p. ej. cuando un juego deja de usarlo."""
+        with self.lock:
+            if path is None:
+                self.entradas.clear()
+            else:
+                self.entradas.pop(os.path.abspath(path), None)
+
+
+cache_cartones = CacheCartones()
 
 
 # -------------------------
@@ -134,161 +560,492 @@ def safe_int(val, default=0):
 # -------------------------
 # Nueva: extraer_matrices_pdf (soporta 4 cartones/hoja + fallback)
 # -------------------------
-def extraer_matrices_pdf(pdf_path, output_json):
+# ==========================
+# PDF DE CARTONES (4 por página)
+# ==========================
+# extraer_matrices_pdf lee los cartones con estas mismas coordenadas
+PDF_MARGEN_X = 0.5 * inch
+PDF_MARGEN_Y = 0.5 * inch
+PDF_CARTONES_POR_PAGINA = 4
+# Por debajo de esta cantidad no compensa repartir el PDF entre procesos
+PDF_MIN_PARALELO = 2000
+# reportlab guarda en memoria todas las páginas de un canvas hasta save():
+# se dibuja por partes de este tamaño para que la memoria no crezca con el total
+PDF_CARTONES_POR_PARTE = 1000
+# Espacio entre las letras B-I-N-G-O y la primera fila de números
+PDF_ESPACIO_LETRAS = 15
+# Adjunto JSON con los cartones del PDF: al volver a subirlo no hay que leer
+# los números por su posición
+PDF_ADJUNTO_CARTONES = "cartones_bingo.json"
+# Biblioteca para leer los números de un PDF sin adjunto (BINGO_LECTOR_PDF o
+# `lector` en /upload); ambas dan los mismos cartones con el layout de /generate
+LECTORES_PDF = ("pdfplumber", "pymupdf")
+PDF_LECTOR = os.environ.get("BINGO_LECTOR_PDF", "pdfplumber")
+# Procesos para dibujar/leer PDFs grandes (0 = uno por núcleo)
+PDF_PROCESOS = int(os.environ.get("BINGO_PROCESOS_PDF", 0))
+# Los pools se crean dentro de peticiones de Flask, con hilos en marcha (guardado de
+# ganadores, /stream, monitores de pymongo): hacer fork de ese proceso puede dejar
+# bloqueado al hijo, así que los procesos se crean desde un servidor limpio
+CONTEXTO_PROCESOS = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn")
+# Por debajo de estas páginas no compensa leer el PDF en paralelo
+PDF_MIN_PAGINAS_PARALELO = 40
+
+
+def geometria_carton(posicion, page_width, page_height):
+    """
+    Coordenadas del cartón en la posición 0-3 (origen abajo a la izquierda, como
+    reportlab): (x, y, card_width, card_height, grid_top, grid_left, cell_w, cell_h).
+    """
+    card_width = (page_width - 2*PDF_MARGEN_X) / 2
+    card_height = (page_height - 2*PDF_MARGEN_Y) / 2
+    row = posicion // 2
+    col = posicion % 2
+    x = PDF_MARGEN_X + col*card_width
+    y = page_height - PDF_MARGEN_Y - (row+1)*card_height
+    grid_top = y + card_height - 55
+    grid_left = x + 10
+    cell_w = (card_width - 20) / 5
+    cell_h = (card_height - 60) / 6
+    return x, y, card_width, card_height, grid_top, grid_left, cell_w, cell_h
+
+
+def dibujar_carton(c, posicion, serial, matrix):
+    """Dibuja un cartón en la posición 0-3 de la página actual del canvas."""
+    x, y, card_width, card_height, grid_top, grid_left, cell_w, cell_h = geometria_carton(posicion, *letter)
+    # Título y serial
+    c.setFont("Helvetica-Bold", 14)
+    c.drawCentredString(x + card_width/2, y + card_height - 15, "BINGO UETS")
+    c.setFont("Helvetica-Bold", 10)
+    c.drawCentredString(x + card_width/2, y + card_height - 30, serial)
+    c.setFont("Helvetica-Bold", 10)
+    for i, L in enumerate(["B","I","N","G","O"]):
+        c.drawCentredString(grid_left + i*cell_w + cell_w/2, grid_top, L)
+    c.setFont("Helvetica", 8)
+    for r in range(5):
+        for col2 in range(5):
+            left = grid_left + col2*cell_w
+            top = grid_top - PDF_ESPACIO_LETRAS - (r+1)*cell_h
+            c.rect(left, top, cell_w, cell_h)
+            val = matrix[r][col2]
+            txt = str(val) if val is not None else " "
+            c.drawCentredString(left + cell_w/2, top + cell_h/2 - 3, txt)
+
+
+def dibujar_cartones(c, cards):
+    """cards: [(serial, matrix)]. Cada página lleva PDF_CARTONES_POR_PAGINA cartones."""
+    for idx, (serial, matrix) in enumerate(cards):
+        page_pos = idx % PDF_CARTONES_POR_PAGINA
+        dibujar_carton(c, page_pos, serial, matrix)
+        if page_pos == PDF_CARTONES_POR_PAGINA-1 or idx == len(cards)-1:
+            c.showPage()
+
+
+def _renderizar_parte(tarea):
+    cards, pdf_path = tarea
+    c = canvas.Canvas(pdf_path, pagesize=letter)
+    dibujar_cartones(c, cards)
+    c.save()
+    return pdf_path
+
+
+def nombre_adjunto(parte):
+    """Nombre del adjunto con los cartones de la parte `parte` del PDF (la primera conserva el nombre de siempre)."""
+    if not parte:
+        return PDF_ADJUNTO_CARTONES
+    base, extension = os.path.splitext(PDF_ADJUNTO_CARTONES)
+    return f"{base}_{parte:05d}{extension}"
+
+
+def adjuntar_cartones_pdf(doc, cards, parte=0, total=None):
+    """
+    Adjunta al documento de PyMuPDF los cartones [(serial, matrix)] de una parte como JSON.
+    La primera parte lleva además el total de cartones del PDF (ver cartones_adjuntos_pdf).
+    """
+    # Se arma cartón a cartón en un solo búfer, sin una lista intermedia de diccionarios
+    contenido = bytearray(b"{")
+    if total is not None:
+        contenido += f'"total":{total},'.encode("utf-8")
+    contenido += b'"cartones":['
+    for i, (serial, matrix) in enumerate(cards):
+        if i:
+            contenido += b","
+        contenido += json.dumps({"serial": serial, "matrix": matrix},
+                                ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    contenido += b"]}"
+    doc.embfile_add(nombre_adjunto(parte), contenido, filename=nombre_adjunto(parte),
+                    desc="Serial y matriz de cada cartón de este PDF")
+
+
+def matriz_valida(matrix):
+    return (
+        isinstance(matrix, list) and len(matrix) == 5
+        and all(isinstance(fila, list) and len(fila) == 5 for fila in matrix)
+        and all(n is None or (isinstance(n, int) and not isinstance(n, bool)) for fila in matrix for n in fila)
+    )
+
+
+def cartones_adjunto(doc, parte):
+    """Cartones de una parte del adjunto; ValueError si alguno no es un cartón válido."""
+    datos = json.loads(doc.embfile_get(nombre_adjunto(parte)))
+    cards = [{"serial": card["serial"], "matrix": card["matrix"]} for card in datos["cartones"]]
+    if not all(isinstance(card["serial"], str) and matriz_valida(card["matrix"]) for card in cards):
+        raise ValueError(f"cartón no válido en {nombre_adjunto(parte)}")
+    return datos.get("total"), cards
+
+
+def cartones_adjuntos_pdf(pdf_path):
+    """
+    Iterador sobre los cartones adjuntos por renderizar_pdf_cartones, o None si el
+    PDF no los trae (PDF de otro origen), no coinciden con sus páginas o no hay
+    PyMuPDF. Se lee una parte cada vez: la memoria no depende del número de cartones.
+    """
+    if pymupdf is None:
+        return None
+    try:
+        with pymupdf.open(pdf_path) as doc:
+            nombres = set(doc.embfile_names())
+            if PDF_ADJUNTO_CARTONES not in nombres:
+                return None
+            paginas = doc.page_count
+            total, primera = cartones_adjunto(doc, 0)
+            if total is None:
+                # PDF anterior al total en la primera parte: se cuentan las partes
+                # sin retenerlas
+                total = len(primera)
+                parte = 1
+                while nombre_adjunto(parte) in nombres:
+                    total += len(cartones_adjunto(doc, parte)[1])
+                    parte += 1
+    except Exception as e:
+        print(f"⚠️ Cartones adjuntos ilegibles en {pdf_path}: {e}")
+        return None
+    # Un PDF editado (páginas quitadas o añadidas) ya no corresponde a su adjunto
+    if -(-total // PDF_CARTONES_POR_PAGINA) != paginas:
+        print(f"⚠️ El adjunto de {pdf_path} no coincide con sus {paginas} páginas; se leen los números del PDF.")
+        return None
+    return _iterar_cartones_adjuntos(pdf_path, primera, total)
+
+
+def _iterar_cartones_adjuntos(pdf_path, primera, total):
+    yield from primera
+    leidos = len(primera)
+    with pymupdf.open(pdf_path) as doc:
+        nombres = set(doc.embfile_names())
+        parte = 1
+        while nombre_adjunto(parte) in nombres:
+            cards = cartones_adjunto(doc, parte)[1]
+            leidos += len(cards)
+            yield from cards
+            parte += 1
+    # Ya validado contra las páginas: solo falla si las partes se alteraron
+    if leidos != total:
+        raise ValueError(f"El adjunto de {pdf_path} trae {leidos} cartones en lugar de {total}")
+
+
+def renderizar_pdf_cartones(cards, pdf_path, procesos=None):
+    """
+    Escribe el PDF de cartones en pdf_path. Se dibuja en partes de páginas completas
+    (en paralelo si son muchos cartones) que se escriben a disco y PyMuPDF añade
+    una a una al archivo final con guardados incrementales; cada página queda igual
+    que dibujada en un solo canvas y la memoria no depende del número de cartones.
+    Con PyMuPDF el PDF lleva además los cartones de cada parte adjuntos como JSON
+    (ver cartones_adjuntos_pdf).
+    """
+    procesos = procesos or PDF_PROCESOS or os.cpu_count() or 1
+    # Sin cartones no hay páginas a las que adjuntar nada
+    if pymupdf is None or not cards:
+        return _renderizar_parte((cards, pdf_path))
+    if len(cards) <= PDF_CARTONES_POR_PARTE:
+        _renderizar_parte((cards, pdf_path))
+        with pymupdf.open(pdf_path) as doc:
+            adjuntar_cartones_pdf(doc, cards, total=len(cards))
+            # Guardado incremental: solo se añade el adjunto al final del archivo
+            doc.saveIncr()
+        return pdf_path
+    paralelo = procesos > 1 and len(cards) >= PDF_MIN_PARALELO
+    if paralelo:
+        # Varios tramos por proceso, sin pasar del tamaño de parte
+        paginas = -(-len(cards) // PDF_CARTONES_POR_PAGINA)
+        tramo = min(-(-paginas // (procesos * 2)) * PDF_CARTONES_POR_PAGINA, PDF_CARTONES_POR_PARTE)
+    else:
+        tramo = PDF_CARTONES_POR_PARTE
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(pdf_path))) as directorio:
+        # Cada tramo empieza en una página nueva
+        tareas = [
+            (cards[i:i + tramo], os.path.join(directorio, f"parte_{i // tramo:05d}.pdf"))
+            for i in range(0, len(cards), tramo)
+        ]
+        if paralelo:
+            with ProcessPoolExecutor(max_workers=procesos, mp_context=CONTEXTO_PROCESOS) as pool:
+                partes = list(pool.map(_renderizar_parte, tareas))
+        else:
+            partes = [_renderizar_parte(tarea) for tarea in tareas]
+        # La primera parte pasa a ser el PDF y cada una de las siguientes se le añade,
+        # con sus cartones adjuntos, en un guardado incremental: en memoria solo
+        # está la parte que se une
+        for k, (parte, (cards_parte, _)) in enumerate(zip(partes, tareas)):
+            if not k:
+                os.replace(parte, pdf_path)
+            with pymupdf.open(pdf_path) as salida:
+                if k:
+                    with pymupdf.open(parte) as doc:
+                        salida.insert_pdf(doc)
+                adjuntar_cartones_pdf(salida, cards_parte, k, None if k else len(cards))
+                salida.saveIncr()
+            if k:
+                os.remove(parte)
+    return pdf_path
+
+
+def cartones_pagina(words, page_width, page_height, page_number):
+    """
+    Cartones de una página con el layout de /generate: cada palabra se asigna a su
+    cartón y casilla con geometria_carton, en una sola pasada sobre las palabras.
+    Las posiciones vacías (última página) no producen cartón.
+    """
+    serial_pattern = re.compile(r'CARD\d{5,}')
+    geometrias = [geometria_carton(p, page_width, page_height) for p in range(PDF_CARTONES_POR_PAGINA)]
+    card_width, card_height = geometrias[0][2], geometrias[0][3]
+    matrices = [[[None] * 5 for _ in range(5)] for _ in geometrias]
+    seriales = [None] * len(geometrias)
+    con_datos = [False] * len(geometrias)
+
+    for w in words:
+        # pdfplumber mide desde arriba de la página; reportlab desde abajo
+        xc = (float(w["x0"]) + float(w["x1"])) / 2
+        yc = page_height - (float(w["top"]) + float(w["bottom"])) / 2
+        card_col = int((xc - PDF_MARGEN_X) // card_width)
+        card_row = int((page_height - PDF_MARGEN_Y - yc) // card_height)
+        if not (0 <= card_col < 2 and 0 <= card_row < 2):
+            continue
+        pos = card_row * 2 + card_col
+        _, _, _, _, grid_top, grid_left, cell_w, cell_h = geometrias[pos]
+        txt = w.get("text", "").strip()
+        r = int((grid_top - PDF_ESPACIO_LETRAS - yc) // cell_h)
+        c = int((xc - grid_left) // cell_w)
+        if 0 <= r < 5 and 0 <= c < 5:
+            m = re.search(r'\d+', txt)
+            if m and matrices[pos][r][c] is None and (r, c) != (2, 2):
+                matrices[pos][r][c] = int(m.group())
+                con_datos[pos] = True
+        elif yc > grid_top and seriales[pos] is None:
+            # Encabezado del cartón: título y serial
+            serial_match = serial_pattern.search(txt)
+            if serial_match:
+                seriales[pos] = serial_match.group()
+                con_datos[pos] = True
+
+    cards = []
+    for pos, matrix in enumerate(matrices):
+        if con_datos[pos]:
+            serial = seriales[pos] or f"PAGE{page_number}_R{pos // 2}C{pos % 2}"
+            cards.append({"serial": serial, "matrix": matrix})
+    return cards
+
+
+def extraer_pagina(page, page_number):
+    """Cartones de una página de pdfplumber."""
+    return cartones_palabras(page.extract_words(), float(page.width), float(page.height), page_number,
+                             lambda: page.extract_text() or "")
+
+
+def extraer_pagina_pymupdf(page, page_number):
+    """Cartones de una página de PyMuPDF: mismas palabras (x0, top, x1, bottom, texto) que pdfplumber."""
+    words = [
+        {"x0": x0, "top": top, "x1": x1, "bottom": bottom, "text": texto}
+        for x0, top, x1, bottom, texto, *_ in page.get_text("words")
+    ]
+    return cartones_palabras(words, page.rect.width, page.rect.height, page_number, lambda: page.get_text())
+
+
+def cartones_palabras(words, page_width, page_height, page_number, texto_pagina):
+    """
+    Cartones de una página a partir de sus palabras (layout de /generate o, si no,
+    por clustering). texto_pagina() da el texto completo, solo para el fallback.
+    """
     serial_pattern = re.compile(r'CARD\d{5}')
     number_pattern = re.compile(r'^\d+$')
     cards_data = []
+    # Intento ESTRUCTURADO: layout generado por /generate (4 por página), si
+    # aparece "BINGO" o "CARD" en la página
+    if any("BINGO" in w["text"].upper() or "CARD" in w["text"].upper() for w in words):
+        return cartones_pagina(words, page_width, page_height, page_number)
+
+    # -------------------------
+    # FALLBACK (cuando no detectamos el layout): agrupación por palabras/clustering
+    # -------------------------
+    page_text = texto_pagina()
+    num_words = []
+    for w in words:
+        txt = w.get('text', '').strip()
+        if number_pattern.match(txt):
+            try:
+                num_words.append({'num': int(txt), 'x': float(w.get('x0', 0)), 'y': float(w.get('top', 0)), 'word': w})
+            except:
+                pass
 
-    with pdfplumber.open(pdf_path) as pdf:
-        for page_number, page in enumerate(pdf.pages, start=1):
-            page_text = page.extract_text() or ""
-            # Intento ESTRUCTURADO: asumimos layout generado por tu /generate (4 por página)
-            page_w = page.width
-            page_h = page.height
-            MARGIN_X = 0.5 * inch
-            MARGIN_Y = 0.5 * inch
-            CARD_WIDTH = (page_w - 2 * MARGIN_X) / 2
-            CARD_HEIGHT = (page_h - 2 * MARGIN_Y) / 2
-
-            # Comprobación rápida: si en el texto aparece "BINGO" o "BINGO UETS" o varios "CARD", aplicamos extracción estructurada
-            if ("BINGO" in page_text.upper()) or ("CARD" in page_text.upper()):
-                # Recorremos la grilla 2x2 (fila, columna) para cada card en la página
-                for card_row in range(2):
-                    for card_col in range(2):
-                        x = MARGIN_X + card_col * CARD_WIDTH
-                        y = page_h - MARGIN_Y - (card_row + 1) * CARD_HEIGHT
-
-                        # coordenadas del grid tal como lo generas en /generate
-                        grid_top = y + CARD_HEIGHT - 55
-                        grid_left = x + 10
-                        cell_w = (CARD_WIDTH - 20) / 5
-                        cell_h = (CARD_HEIGHT - 60) / 6
-
-                        matrix = []
-                        for r in range(5):
-                            row = []
-                            for c in range(5):
-                                if r == 2 and c == 2:
-                                    row.append(None)
-                                    continue
-                                bbox = (
-                                    grid_left + c * cell_w,
-                                    grid_top - (r + 1) * cell_h,
-                                    grid_left + (c + 1) * cell_w,
-                                    grid_top - r * cell_h
-                                )
-                                cropped = page.within_bbox(bbox)
-                                txt = (cropped.extract_text() or "").strip()
-                                num = None
-                                if txt:
-                                    m = re.search(r'\d+', txt)
-                                    if m:
-                                        try:
-                                            num = int(m.group())
-                                        except:
-                                            num = None
-                                else:
-                                    # intentar con palabras si extract_text no devolvió nada
-                                    words = cropped.extract_words()
-                                    if words:
-                                        center_x = (bbox[0] + bbox[2]) / 2
-                                        best = min(words, key=lambda w: abs(float(w.get('x0', 0)) - center_x))
-                                        try:
-                                            num = int(best.get('text', '').strip())
-                                        except:
-                                            num = None
-                                row.append(num)
-                            matrix.append(row)
-
-                        # Buscar serial dentro del área superior del card (donde lo dibujas)
-                        header_bbox = (x, y + CARD_HEIGHT - 45, x + CARD_WIDTH, y + CARD_HEIGHT - 10)
-                        header_crop = page.within_bbox(header_bbox)
-                        header_txt = (header_crop.extract_text() or "") + " " + page_text  # fallback al page_text
-                        serial_match = serial_pattern.search(header_txt)
-                        if serial_match:
-                            serial = serial_match.group()
+    if not num_words:
+        return cards_data
+
+    # Intento agrupar en 5x5 por clustering global
+    xs = [w['x'] for w in num_words]
+    ys = [w['y'] for w in num_words]
+    x_centers = cluster_positions(xs, max_gap=18)
+    y_centers = cluster_positions(ys, max_gap=12)
+    if len(x_centers) < 5:
+        x_centers = cluster_positions(xs, max_gap=30)
+    if len(y_centers) < 5:
+        y_centers = cluster_positions(ys, max_gap=20)
+
+    # Si clustering no nos dio 5x5, fallback secuencial por texto
+    if len(x_centers) < 5 or len(y_centers) < 5:
+        # tomar los números del texto en orden y formar n cartones de 24 números
+        numbers = [int(n) for n in re.findall(r'\b\d+\b', page_text)]
+        serials = serial_pattern.findall(page_text)
+        if serials:
+            # eliminar número del serial si aparece como número suelto (ej: 79)
+            try:
+                serial_num = int(serials[0].replace('CARD', ''))
+                numbers = [n for n in numbers if n != serial_num]
+            except:
+                pass
+        if len(numbers) >= 24:
+            groups = len(numbers) // 24
+            for i in range(groups):
+                nums = numbers[i*24:(i+1)*24]
+                matrix = []
+                idx = 0
+                for r in range(5):
+                    row = []
+                    for c in range(5):
+                        if r == 2 and c == 2:
+                            row.append(None)
                         else:
-                            serial = f"PAGE{page_number}_R{card_row}C{card_col}"
+                            row.append(nums[idx] if idx < len(nums) else None)
+                            idx += 1
+                    matrix.append(row)
+                s = serials[i] if i < len(serials) else f"PAGE{page_number}_SEQ{i+1}"
+                cards_data.append({"serial": s, "matrix": matrix})
+        return cards_data
+
+    # reconstruir grid usando centres
+    x_centers = sorted(x_centers)
+    y_centers = sorted(y_centers)
+    grid = [[None for _ in range(5)] for _ in range(5)]
+    for it in num_words:
+        col_idx = nearest_index(x_centers, it['x'])
+        row_idx = nearest_index(y_centers, it['y'])
+        if col_idx is None or row_idx is None:
+            continue
+        if 0 <= row_idx < 5 and 0 <= col_idx < 5:
+            if grid[row_idx][col_idx] is None:
+                grid[row_idx][col_idx] = it['num']
+    grid[2][2] = None
+    serials = serial_pattern.findall(page_text)
+    serial = serials[0] if serials else f"PAGE{page_number}_AUTO"
+    cards_data.append({"serial": serial, "matrix": grid})
+    return cards_data
 
-                        # Asegurar centro libre
-                        matrix[2][2] = None
-                        cards_data.append({"serial": serial, "matrix": matrix})
-                # continuar con la siguiente página
-                continue
 
-            # -------------------------
-            # FALLBACK (cuando no detectamos el layout): agrupación por palabras/clustering
-            # -------------------------
-            words = page.extract_words()
-            num_words = []
-            for w in words:
-                txt = w.get('text', '').strip()
-                if number_pattern.match(txt):
-                    try:
-                        num_words.append({'num': int(txt), 'x': float(w.get('x0', 0)), 'y': float(w.get('top', 0)), 'word': w})
-                    except:
-                        pass
-
-            if not num_words:
-                continue
+# Páginas por tarea al leer un PDF en paralelo: los cartones van saliendo en orden
+# por tramos pequeños, con pocos tramos pendientes a la vez
+PDF_PAGINAS_POR_TRAMO = 25
+_pdf_extraccion = {}
 
-            # Intento agrupar en 5x5 por clustering global
-            xs = [w['x'] for w in num_words]
-            ys = [w['y'] for w in num_words]
-            x_centers = cluster_positions(xs, max_gap=18)
-            y_centers = cluster_positions(ys, max_gap=12)
-            if len(x_centers) < 5:
-                x_centers = cluster_positions(xs, max_gap=30)
-            if len(y_centers) < 5:
-                y_centers = cluster_positions(ys, max_gap=20)
-
-            # Si clustering no nos dio 5x5, fallback secuencial por texto
-            if len(x_centers) < 5 or len(y_centers) < 5:
-                # tomar los números del texto en orden y formar n cartones de 24 números
-                numbers = [int(n) for n in re.findall(r'\b\d+\b', page_text)]
-                serials = serial_pattern.findall(page_text)
-                if serials:
-                    # eliminar número del serial si aparece como número suelto (ej: 79)
-                    try:
-                        serial_num = int(serials[0].replace('CARD', ''))
-                        numbers = [n for n in numbers if n != serial_num]
-                    except:
-                        pass
-                if len(numbers) >= 24:
-                    groups = len(numbers) // 24
-                    for i in range(groups):
-                        nums = numbers[i*24:(i+1)*24]
-                        matrix = []
-                        idx = 0
-                        for r in range(5):
-                            row = []
-                            for c in range(5):
-                                if r == 2 and c == 2:
-                                    row.append(None)
-                                else:
-                                    row.append(nums[idx] if idx < len(nums) else None)
-                                    idx += 1
-                            matrix.append(row)
-                        s = serials[i] if i < len(serials) else f"PAGE{page_number}_SEQ{i+1}"
-                        cards_data.append({"serial": s, "matrix": matrix})
-                continue
 
-            # reconstruir grid usando centres
-            x_centers = sorted(x_centers)
-            y_centers = sorted(y_centers)
-            grid = [[None for _ in range(5)] for _ in range(5)]
-            for it in num_words:
-                col_idx = nearest_index(x_centers, it['x'])
-                row_idx = nearest_index(y_centers, it['y'])
-                if col_idx is None or row_idx is None:
-                    continue
-                if 0 <= row_idx < 5 and 0 <= col_idx < 5:
-                    if grid[row_idx][col_idx] is None:
-                        grid[row_idx][col_idx] = it['num']
-            grid[2][2] = None
-            serials = serial_pattern.findall(page_text)
-            serial = serials[0] if serials else f"PAGE{page_number}_AUTO"
-            cards_data.append({"serial": serial, "matrix": grid})
+def contar_paginas_pdf(pdf):
+    return int(resolve1(pdf.doc.catalog["Pages"])["Count"])
+
+
+def paginas_pdf(pdf):
+    """
+    Páginas de pdfplumber una a una, como pdf.pages pero sin guardar la lista:
+    pdf.pages (y la caché de objetos de pdfminer) retiene el contenido ya
+    decodificado de todas las páginas, unos 7 KB por página.
+    """
+    pdf.doc.caching = False
+    doctop = 0
+    for page_number, page_obj in enumerate(PDFPage.create_pages(pdf.doc), start=1):
+        page = Page(pdf, page_obj, page_number=page_number, initial_doctop=doctop)
+        doctop += page.height
+        yield page
+
+
+def _abrir_pdf_extraccion(pdf_path):
+    """Inicializador de cada proceso: abre el PDF una sola vez para todas sus tareas."""
+    pdf = pdfplumber.open(pdf_path)
+    _pdf_extraccion.update(pdf=pdf, paginas=paginas_pdf(pdf), siguiente=1)
+
+
+def _extraer_paginas(tramo):
+    """
+    Cartones de las páginas [inicio, fin) del PDF abierto en este proceso. Cada
+    proceso recibe sus tramos en orden, así que recorre el PDF una sola vez.
+    """
+    inicio, fin = tramo
+    if inicio + 1 < _pdf_extraccion["siguiente"]:
+        _pdf_extraccion.update(paginas=paginas_pdf(_pdf_extraccion["pdf"]), siguiente=1)
+    cards_data = []
+    for page in _pdf_extraccion["paginas"]:
+        _pdf_extraccion["siguiente"] = page.page_number + 1
+        if page.page_number <= inicio:
+            continue  # página de un tramo de otro proceso
+        cards_data.extend(extraer_pagina(page, page.page_number))
+        # Libera el contenido ya leído de la página
+        page.close()
+        if page.page_number >= fin:
+            break
+    return cards_data
+
+
+def iterar_cartones_pdf(pdf_path, procesos=None, usar_adjunto=True, lector=None):
+    """
+    Generador de los cartones del PDF en orden de página. Si el PDF trae los
+    cartones adjuntos (generado por este sistema) se usan directamente. Si no, se
+    leen las páginas con `lector` (LECTORES_PDF). Con pdfplumber y muchas páginas
+    se reparten por tramos entre procesos (mismo resultado y orden que en uno
+    solo) y como mucho hay dos tramos pendientes por proceso, así que la memoria
+    no depende del tamaño del PDF. PyMuPDF lee en C y va página a página en un
+    solo proceso.
+    """
+    if usar_adjunto:
+        adjuntos = cartones_adjuntos_pdf(pdf_path)
+        if adjuntos is not None:
+            yield from adjuntos
+            return
+    lector = lector or PDF_LECTOR
+    if lector == "pymupdf" and pymupdf is None:
+        print("⚠️ PyMuPDF no está instalado: el PDF se lee con pdfplumber.")
+        lector = "pdfplumber"
+    if lector == "pymupdf":
+        with pymupdf.open(pdf_path) as doc:
+            for page in doc:
+                yield from extraer_pagina_pymupdf(page, page.number + 1)
+        return
+    procesos = procesos or PDF_PROCESOS or os.cpu_count() or 1
+    with pdfplumber.open(pdf_path) as pdf:
+        paginas = contar_paginas_pdf(pdf)
+        if procesos == 1 or paginas < PDF_MIN_PAGINAS_PARALELO:
+            for page in paginas_pdf(pdf):
+                yield from extraer_pagina(page, page.page_number)
+                page.close()
+            return
+
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=CONTEXTO_PROCESOS,
+                             initializer=_abrir_pdf_extraccion, initargs=(pdf_path,)) as pool:
+        pendientes = deque()
+        for inicio in range(0, paginas, PDF_PAGINAS_POR_TRAMO):
+            pendientes.append(pool.submit(_extraer_paginas, (inicio, min(inicio + PDF_PAGINAS_POR_TRAMO, paginas))))
+            if len(pendientes) >= procesos * 2:
+                yield from pendientes.popleft().result()
+        while pendientes:
+            yield from pendientes.popleft().result()
+
+
+def extraer_matrices_pdf(pdf_path, output_json, procesos=None, usar_adjunto=True, lector=None):
+    """Extrae todos los cartones del PDF (ver iterar_cartones_pdf) y los guarda en output_json."""
+    cards_data = list(iterar_cartones_pdf(pdf_path, procesos, usar_adjunto, lector))
 
     # Guardar resultado en JSON
     with open(output_json, "w", encoding="utf-8") as f:
@@ -312,6 +1069,880 @@ def check_winner_py(marks):
     return False
 
 
+# --- Guarda los ganadores nuevos en MongoDB (una sola escritura por colección) ---
+def persistir_ganadores(cards, patron=None, game_id=None):
+    if not cards:
+        return True
+    ahora = time.time()
+    try:
+        mongo_collection_winners.bulk_write([
+            UpdateOne(
+                {"serial": card["serial"]},
+                {"$set": {
+                    "serial": card["serial"],
+                    "matrix": card["matrix"],
+                    "won": True,
+                    "patron": patron,
+                    "game_id": game_id,
+                    "timestamp": ahora
+                }},
+                upsert=True
+            )
+            for card in cards
+        ], ordered=False)
+        # 🔄 Actualizar estado 'won' de las tablas ganadoras
+        mongo_collection_tables.bulk_write([
+            UpdateOne({"serial": card["serial"]}, {"$set": {"won": True}})
+            for card in cards
+        ], ordered=False)
+        print(f"✅ Cartones ganadores guardados en MongoDB: {', '.join(c['serial'] for c in cards)}")
+        return True
+    except Exception as e:
+        print(f"❌ Error al guardar los ganadores {[c['serial'] for c in cards]}: {e}")
+        return False
+
+
+# ==========================
+# CARTÓN COMO MÁSCARA DE 25 BITS
+# ==========================
+# Cada casilla (fila, columna) es el bit fila*5 + columna. Las marcas de un cartón
+# caben en un solo int y ganar o contar aciertos se reduce a AND y popcount.
+BIT_CENTRO = 1 << 12
+MASCARA_COMPLETA = (1 << 25) - 1
+# Peso de cada casilla para empaquetar una fila (25,) de bools en la máscara
+PESOS_BITS = (1 << np.arange(25, dtype=np.int64)) if np is not None else None
+
+
+def bit_casilla(r, c):
+    return 1 << (r * 5 + c)
+
+
+def mascara_celdas(celdas):
+    mask = 0
+    for r, c in celdas:
+        mask |= bit_casilla(r, c)
+    return mask
+
+
+# 5 filas, 5 columnas y 2 diagonales: mismas líneas que check_winner_py
+LINEAS_GANADORAS = (
+    [mascara_celdas([(r, c) for c in range(5)]) for r in range(5)]
+    + [mascara_celdas([(r, c) for r in range(5)]) for c in range(5)]
+    + [mascara_celdas([(i, i) for i in range(5)]), mascara_celdas([(i, 4 - i) for i in range(5)])]
+)
+
+
+def contar_bits(mask):
+    return bin(mask).count("1")
+
+
+def marcas_a_mascara(marks):
+    mask = 0
+    for r in range(5):
+        for c in range(5):
+            if marks[r][c]:
+                mask |= bit_casilla(r, c)
+    return mask
+
+
+def mascara_a_marcas(mask):
+    return [[bool(mask & bit_casilla(r, c)) for c in range(5)] for r in range(5)]
+
+
+def mascara_libres(matrix):
+    """Casillas sin número (centro libre o vacías), que cuentan como acierto."""
+    mask = BIT_CENTRO
+    for r in range(5):
+        for c in range(5):
+            if matrix[r][c] is None:
+                mask |= bit_casilla(r, c)
+    return mask
+
+
+def gana_patron(mask, mascaras_patron):
+    """El cartón gana si sus casillas cubren alguna de las máscaras del patrón."""
+    for m in mascaras_patron:
+        if mask & m == m:
+            return True
+    return False
+
+
+def check_winner_mask(mask):
+    """Equivalente a check_winner_py sobre la máscara de marcas."""
+    return gana_patron(mask, LINEAS_GANADORAS)
+
+
+# ==========================
+# PATRONES DE VICTORIA
+# ==========================
+# Cada patrón se compila una sola vez a una lista de máscaras de 25 bits y se
+# evalúa contra las casillas marcadas o libres de cada cartón.
+def compilar_patron(figuras):
+    return [mascara_celdas(celdas) for celdas in figuras]
+
+
+PATRONES = {
+    # Cualquier fila, columna o diagonal
+    "linea": LINEAS_GANADORAS,
+    "cuatro_esquinas": compilar_patron([[(0, 0), (0, 4), (4, 0), (4, 4)]]),
+    "x": compilar_patron([[(i, i) for i in range(5)] + [(i, 4 - i) for i in range(5)]]),
+    # Primera columna + última fila
+    "l": compilar_patron([[(r, 0) for r in range(5)] + [(4, c) for c in range(5)]]),
+    # Cartón lleno (los 25 aciertos)
+    "lleno": [MASCARA_COMPLETA],
+}
+PATRON_POR_DEFECTO = "lleno"
+
+
+def casillas_faltantes(efectiva, mascaras_patron):
+    """Casillas (bits) que, marcadas solas, completarían alguna máscara del patrón."""
+    faltan = set()
+    for m in mascaras_patron:
+        resto = m & ~efectiva
+        # Exactamente una casilla por cubrir
+        if resto and resto & (resto - 1) == 0:
+            faltan.add(resto.bit_length() - 1)
+    return faltan
+
+
+def numeros_faltantes(matrix, casillas):
+    """Números de esas casillas que pueden cantarse."""
+    return {num for num in (matrix[k // 5][k % 5] for k in casillas) if numero_valido(num)}
+
+
+def numero_valido(num):
+    """Solo números que caben en un uint8 pueden cantarse (iguales en ambos motores)."""
+    return isinstance(num, int) and 0 < num < 256
+
+
+# ==========================
+# MOTORES DEL JUEGO (python / numpy)
+# ==========================
+class MotorPython:
+    """Marcas como int de 25 bits por cartón e índice invertido número -> casillas."""
+    nombre = "python"
+
+    def __init__(self, cards, mascaras=None):
+        self.mascaras = []
+        # Casillas sin número de cada cartón (cuentan como acierto en /progress)
+        self.libres = []
+        # Índice invertido: número -> [(índice de cartón, bit de la casilla)]
+        indice = defaultdict(list)
+        if isinstance(cards, CartonesBinarios):
+            self._desde_binarios(cards, mascaras)
+            return
+        for i, card in enumerate(cards):
+            matrix = card["matrix"]
+            if mascaras is not None:
+                mask = mascaras[i]
+            else:
+                marks = card.get("marks")
+                mask = marcas_a_mascara(marks) if marks else 0
+            # Centro libre siempre marcado
+            self.mascaras.append(mask | BIT_CENTRO)
+            self.libres.append(mascara_libres(matrix))
+            for r in range(5):
+                for c in range(5):
+                    num = matrix[r][c]
+                    if numero_valido(num) and not (r == 2 and c == 2):
+                        indice[num].append((i, bit_casilla(r, c)))
+        self.indice = dict(indice)
+
+    def _desde_binarios(self, cards, mascaras):
+        """Mismo estado que recorriendo los cartones, armado con NumPy desde los registros."""
+        matrices = cards.matrices()
+        self.libres = (((matrices == 0).astype(np.int64) @ PESOS_BITS) | BIT_CENTRO).tolist()
+        if mascaras is not None:
+            self.mascaras = [m | BIT_CENTRO for m in mascaras]
+        else:
+            self.mascaras = [BIT_CENTRO] * len(cards)
+        # Casillas ordenadas por número: cada número es un tramo contiguo
+        plano = matrices.ravel()
+        orden = np.argsort(plano, kind="stable")
+        numeros, inicios = np.unique(plano[orden], return_index=True)
+        cartones = (orden // 25).tolist()
+        bits = (1 << (orden % 25)).tolist()
+        fines = inicios[1:].tolist() + [len(orden)]
+        self.indice = {
+            num: list(zip(cartones[a:b], bits[a:b]))
+            for num, a, b in zip(numeros.tolist(), inicios.tolist(), fines)
+            if num
+        }
+
+    def marcar(self, num, marcado):
+        """Aplica la bola y devuelve los índices de los cartones que la contienen."""
+        mascaras = self.mascaras
+        tocados = set()
+        for i, bit in self.indice.get(num, ()):
+            if marcado:
+                mascaras[i] |= bit
+            else:
+                mascaras[i] &= ~bit
+            tocados.add(i)
+        return tocados
+
+    def mascara(self, i):
+        return self.mascaras[i]
+
+    def mascaras_todas(self):
+        return list(self.mascaras)
+
+    def aciertos(self, i):
+        return contar_bits(self.mascaras[i] | self.libres[i])
+
+    def aciertos_todos(self):
+        return [contar_bits(m | l) for m, l in zip(self.mascaras, self.libres)]
+
+    def aciertos_de(self, indices):
+        return [contar_bits(self.mascaras[i] | self.libres[i]) for i in indices]
+
+    def efectivas_de(self, indices):
+        """Casillas marcadas o libres de cada cartón."""
+        return [self.mascaras[i] | self.libres[i] for i in indices]
+
+    def efectivas_todas(self):
+        return [m | l for m, l in zip(self.mascaras, self.libres)]
+
+    def ganan(self, indices, mascaras_patron):
+        return [gana_patron(self.mascaras[i] | self.libres[i], mascaras_patron) for i in indices]
+
+    def ganadores(self, mascaras_patron):
+        return [
+            i for i, (m, l) in enumerate(zip(self.mascaras, self.libres))
+            if gana_patron(m | l, mascaras_patron)
+        ]
+
+
+class MotorNumpy:
+    """
+    Todos los cartones como arreglo (N, 25) uint8 y marcas (N, 25) bool.
+    Una bola es un solo `matrices == num` y los ganadores una reducción
+    contra las máscaras del patrón activo.
+    """
+    nombre = "numpy"
+
+    def __init__(self, cards, mascaras=None):
+        n = len(cards)
+        self.matrices = np.zeros((n, 25), dtype=np.uint8)
+        self.marcas = np.zeros((n, 25), dtype=bool)
+        self.libres = np.zeros((n, 25), dtype=bool)
+        if isinstance(cards, CartonesBinarios):
+            # Cartones ya empaquetados: sin recorrer cada uno
+            self.matrices = cards.matrices()
+            self.libres = self.matrices == 0
+            cards = ()
+        for i, card in enumerate(cards):
+            matrix = card["matrix"]
+            marks = card.get("marks")
+            for r in range(5):
+                for c in range(5):
+                    num = matrix[r][c]
+                    k = r * 5 + c
+                    if num is None:
+                        self.libres[i, k] = True
+                    elif numero_valido(num):
+                        self.matrices[i, k] = num
+                    if marks and marks[r][c]:
+                        self.marcas[i, k] = True
+        if mascaras is not None and n:
+            empaquetadas = np.asarray(mascaras, dtype=np.int64)
+            self.marcas = ((empaquetadas[:, None] & PESOS_BITS) != 0)
+        # Centro libre siempre marcado y nunca coincide con una bola
+        self.matrices[:, 12] = 0
+        self.marcas[:, 12] = True
+        self.libres[:, 12] = True
+
+    def marcar(self, num, marcado):
+        if not numero_valido(num):
+            return np.zeros(0, dtype=np.intp)
+        coincide = self.matrices == num
+        self.marcas[coincide] = marcado
+        return np.flatnonzero(coincide.any(axis=1))
+
+    def mascara(self, i):
+        return int(self.marcas[i].astype(np.int64) @ PESOS_BITS)
+
+    def mascaras_todas(self):
+        return (self.marcas.astype(np.int64) @ PESOS_BITS).tolist()
+
+    def aciertos(self, i):
+        return int((self.marcas[i] | self.libres[i]).sum())
+
+    def aciertos_todos(self):
+        return (self.marcas | self.libres).sum(axis=1).tolist()
+
+    def aciertos_de(self, indices):
+        indices = np.asarray(indices, dtype=np.intp)
+        return (self.marcas[indices] | self.libres[indices]).sum(axis=1).tolist()
+
+    def efectivas_de(self, indices):
+        indices = np.asarray(indices, dtype=np.intp)
+        return ((self.marcas[indices] | self.libres[indices]).astype(np.int64) @ PESOS_BITS).tolist()
+
+    def efectivas_todas(self):
+        return ((self.marcas | self.libres).astype(np.int64) @ PESOS_BITS).tolist()
+
+    def _gana(self, marcas, libres, mascaras_patron):
+        efectivas = (marcas | libres).astype(np.int64) @ PESOS_BITS
+        patron = np.array(mascaras_patron, dtype=np.int64)
+        return ((efectivas[:, None] & patron) == patron).any(axis=1)
+
+    def ganan(self, indices, mascaras_patron):
+        indices = np.asarray(indices, dtype=np.intp)
+        return self._gana(self.marcas[indices], self.libres[indices], mascaras_patron).tolist()
+
+    def ganadores(self, mascaras_patron):
+        return np.flatnonzero(self._gana(self.marcas, self.libres, mascaras_patron)).tolist()
+
+
+MOTORES_JUEGO = {"python": MotorPython, "numpy": MotorNumpy}
+
+
+def crear_motor(cards, nombre=None, mascaras=None):
+    nombre = nombre or MOTOR_JUEGO
+    if nombre == "numpy" and np is None:
+        print("⚠️ NumPy no está instalado, se usa el motor python.")
+        nombre = "python"
+    motor_cls = MOTORES_JUEGO.get(nombre)
+    if motor_cls is None:
+        raise ValueError(f"Motor de juego desconocido: {nombre}")
+    return motor_cls(cards, mascaras)
+
+
+# ==========================
+# ESTADO DEL JUEGO EN MEMORIA
+# ==========================
+class JuegoBingo:
+    """
+    Estado residente de un juego (sesión): sus cartones, marcas, historial de
+    bolas y pantallas suscritas. Cada sala tiene el suyo en el registro `juegos`
+    y /mark, /progress y /get_cards lo eligen por game_id.
+
+    Durabilidad: el JSON del juego no se reescribe. Cada bola se agrega a un
+    registro de solo anexado (<juego>.bolas.jsonl) y cada SNAPSHOT_CADA bolas
+    se guarda un snapshot compacto de las marcas (<juego>.snapshot). Al arrancar
+    se restaura el snapshot y se reproducen las bolas posteriores.
+    """
+
+    def __init__(self, motor=None, game_id=JUEGO_PRINCIPAL):
+        self.lock = threading.RLock()
+        self.game_id = game_id
+        self.nombre_motor = motor
+        # Patrón de victoria activo (ver PATRONES)
+        self.patron = PATRON_POR_DEFECTO
+        self.cards = []
+        self.por_serial = {}
+        self.motor = crear_motor([], motor)
+        # Aciertos de cada cartón, mantenidos en cada bola
+        self.aciertos_cartones = []
+        # Ranking por cubetas: ranking[aciertos] = {índice: None} (orden de llegada)
+        self.ranking = [{} for _ in range(26)]
+        # Cartones que cumplen el patrón activo, en orden de llegada
+        self.ganadores = {}
+        # Ganadores aún no guardados en MongoDB / ya guardados en este juego
+        self.pendientes = {}
+        self.persistidos = set()
+        # "A una bola": número -> {índice: None} de cartones que ganarían con él,
+        # y su inverso índice -> números que le faltan (solo cartones no ganadores)
+        self.casi = {}
+        self.faltantes = {}
+        # Bolas cantadas y cambios de patrón: [{"seq", "num", "marcado", "ts"} | {"seq", "patron", "ts"}]
+        self.historial = []
+        self.seq = 0
+        self.seq_snapshot = 0
+        # Orden en que se arman los snapshots y último escrito (ver guardar_snapshot)
+        self._lock_snapshot = threading.Lock()
+        self._snapshot_armado = 0
+        self._snapshot_escrito = 0
+        self._registro = None
+        self.json_path = None
+        # Versión del conjunto de cartones (ver CacheCartones) y /get_cards ya serializado
+        self.version = ""
+        self._json_cartones = None
+        # Pantallas conectadas a /stream de este juego
+        self.eventos = PublicadorEventos()
+
+    # --- Carga de cartones ---
+    def cargar(self, cards, json_path=None, mascaras=None, patron=None, version=None, persistidos=()):
+        with self.lock:
+            self._cerrar_registro()
+            # Sin JSON del que derivarla: una marca de tiempo, que tampoco se repite entre reinicios
+            self.version = version if version is not None else f"{time.time_ns():x}"
+            self._json_cartones = None
+            self.cards = cards
+            seriales = cards.seriales() if isinstance(cards, CartonesBinarios) else (c["serial"] for c in cards)
+            self.por_serial = {serial: i for i, serial in enumerate(seriales)}
+            self.motor = crear_motor(cards, self.nombre_motor, mascaras)
+            self.aciertos_cartones = self.motor.aciertos_todos()
+            self.ranking = [{} for _ in range(26)]
+            self.ganadores = {}
+            self.pendientes = {}
+            # Ganadores ya guardados antes de un reinicio (ver guardar_snapshot)
+            self.persistidos = {self.por_serial[s] for s in persistidos if s in self.por_serial}
+            for i, aciertos in enumerate(self.aciertos_cartones):
+                self.ranking[aciertos][i] = None
+            self.patron = patron if patron in PATRONES else PATRON_POR_DEFECTO
+            for i in self.motor.ganadores(PATRONES[self.patron]):
+                self.ganadores[i] = None
+                if i not in self.persistidos:
+                    self.pendientes[i] = None
+            self._recalcular_casi()
+            self.historial = []
+            self.seq = 0
+            self.seq_snapshot = 0
+            self.json_path = json_path
+
+    def restaurar(self, cards, json_path, version=None):
+        """Carga los cartones y reconstruye las marcas desde snapshot + registro de bolas."""
+        registro_path, snapshot_path = rutas_respaldo(json_path)
+        mascaras = None
+        patron = None
+        persistidos = ()
+        seq_snapshot = 0
+        if os.path.exists(snapshot_path):
+            try:
+                with open(snapshot_path, "r", encoding="utf-8") as f:
+                    snapshot = json.load(f)
+                if len(snapshot.get("mascaras", [])) == len(cards):
+                    mascaras = snapshot["mascaras"]
+                    patron = snapshot.get("patron")
+                    persistidos = snapshot.get("persistidos", ())
+                    seq_snapshot = snapshot.get("seq", 0)
+            except Exception as e:
+                print(f"⚠️ Snapshot ilegible ({snapshot_path}), se reproduce todo el registro: {e}")
+        with self.lock:
+            self.cargar(cards, json_path, mascaras, patron, version, persistidos)
+            for entrada in leer_registro_bolas(registro_path):
+                self.historial.append(entrada)
+                self.seq = entrada["seq"]
+                if entrada["seq"] <= seq_snapshot:
+                    continue
+                if "patron" in entrada:
+                    self._aplicar_patron(entrada["patron"])
+                else:
+                    self._aplicar(entrada["num"], entrada["marcado"])
+            self.seq_snapshot = seq_snapshot
+
+    def restaurar_json(self, json_path):
+        cards, version = cache_cartones.leer(json_path)
+        self.restaurar(cards, json_path, version)
+
+    def nuevo(self, cards, json_path, patron, version=None):
+        """Empieza un juego nuevo sobre json_path, descartando un respaldo previo con la misma ruta."""
+        with self.lock:
+            self._cerrar_registro()
+            for ruta in rutas_respaldo(json_path):
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+            if self.json_path and os.path.abspath(self.json_path) != os.path.abspath(json_path):
+                # El JSON anterior de esta sala ya no se sirve: no retener sus cartones
+                cache_cartones.invalidar(self.json_path)
+            self.cargar(cards, json_path, version=version)
+            # Queda como primera entrada del registro de bolas del juego
+            self.cambiar_patron(patron)
+
+    def bolas_registradas(self):
+        """Bolas del historial; los cambios de patrón (incluido el inicial) no cuentan."""
+        with self.lock:
+            return sum(1 for entrada in self.historial if "num" in entrada)
+
+    def en_curso(self):
+        """Hay un juego a medias: ya se cantó alguna bola."""
+        return self.bolas_registradas() > 0
+
+    def info(self):
+        with self.lock:
+            return {
+                "game_id": self.game_id,
+                "cartones": len(self.cards),
+                "seq": self.seq,
+                "patron": self.patron,
+                "ganadores": len(self.ganadores),
+                "version": self.version,
+                "json_path": self.json_path
+            }
+
+    # --- Operaciones del juego ---
+    def marcar(self, num, marcado=True):
+        """Aplica la bola y devuelve los cartones que ganaron con ella."""
+        with self.lock:
+            nuevos_ganadores = self._aplicar(num, marcado)
+            self._registrar({"num": num, "marcado": bool(marcado)})
+            return [self.resumen(i) for i in sorted(nuevos_ganadores)]
+
+    def cambiar_patron(self, patron):
+        """Activa otro patrón de victoria y devuelve los cartones que pasan a ganar."""
+        if patron not in PATRONES:
+            raise ValueError(f"Patrón desconocido: {patron}")
+        with self.lock:
+            nuevos_ganadores = self._aplicar_patron(patron)
+            self._registrar({"patron": patron})
+            return [self.resumen(i) for i in sorted(nuevos_ganadores)]
+
+    def _aplicar_patron(self, patron):
+        self.patron = patron
+        anteriores = self.ganadores
+        self.ganadores = {i: None for i in self.motor.ganadores(PATRONES[patron])}
+        self.pendientes = {i: None for i in self.ganadores if i not in self.persistidos}
+        self._recalcular_casi()
+        return [i for i in self.ganadores if i not in anteriores]
+
+    def _aplicar(self, num, marcado):
+        tocados = self.motor.marcar(num, marcado)
+        return self._actualizar_ranking(tocados)
+
+    def _actualizar_ranking(self, tocados):
+        """
+        Mueve de cubeta solo los cartones cuya cantidad de aciertos cambió y
+        evalúa el patrón activo únicamente sobre los cartones tocados.
+        """
+        nuevos_ganadores = []
+        if len(tocados) == 0:
+            return nuevos_ganadores
+        tocados = list(tocados)
+        aciertos = self.motor.aciertos_de(tocados)
+        ganan = self.motor.ganan(tocados, PATRONES[self.patron])
+        for i, nuevos, gana in zip(tocados, aciertos, ganan):
+            anteriores = self.aciertos_cartones[i]
+            if nuevos != anteriores:
+                del self.ranking[anteriores][i]
+                self.ranking[nuevos][i] = None
+                self.aciertos_cartones[i] = nuevos
+            if gana and i not in self.ganadores:
+                self.ganadores[i] = None
+                nuevos_ganadores.append(i)
+                if i not in self.persistidos:
+                    self.pendientes[i] = None
+            elif not gana and i in self.ganadores:
+                del self.ganadores[i]
+                self.pendientes.pop(i, None)
+        self._actualizar_casi(tocados, self.motor.efectivas_de(tocados))
+        return nuevos_ganadores
+
+    # --- Índice "a una bola" ---
+    def _recalcular_casi(self):
+        self.casi = {}
+        self.faltantes = {}
+        self._actualizar_casi(range(len(self.cards)), self.motor.efectivas_todas())
+
+    def _actualizar_casi(self, indices, efectivas):
+        """Recalcula los números que le faltan a cada cartón tocado (12 máscaras como máximo)."""
+        mascaras_patron = PATRONES[self.patron]
+        for i, efectiva in zip(indices, efectivas):
+            anteriores = self.faltantes.pop(i, ())
+            for num in anteriores:
+                cartones = self.casi[num]
+                del cartones[i]
+                if not cartones:
+                    del self.casi[num]
+            if i in self.ganadores:
+                continue
+            casillas = casillas_faltantes(efectiva, mascaras_patron)
+            if not casillas:
+                continue
+            # Solo entonces se consulta el cartón (los binarios se arman al vuelo)
+            faltan = numeros_faltantes(self.cards[i]["matrix"], casillas)
+            if faltan:
+                self.faltantes[i] = faltan
+                for num in faltan:
+                    self.casi.setdefault(num, {})[i] = None
+
+    def casi_ganadores(self, num=None):
+        """Cartones a una bola de ganar, agrupados por el número que necesitan."""
+        with self.lock:
+            numeros = [num] if num is not None else sorted(self.casi)
+            return {
+                n: [self.cards[i]["serial"] for i in self.casi.get(n, ())]
+                for n in numeros
+            }
+
+    def aciertos(self, i):
+        return self.aciertos_cartones[i]
+
+    def aciertos_todos(self):
+        with self.lock:
+            return list(self.aciertos_cartones)
+
+    def resumen(self, i):
+        return {"serial": self.cards[i]["serial"], "aciertos": self.aciertos_cartones[i], "won": i in self.ganadores}
+
+    def lideres(self, top=3):
+        """Los `top` cartones con más aciertos, recorriendo las cubetas de mayor a menor."""
+        with self.lock:
+            lideres = []
+            for aciertos in range(25, -1, -1):
+                for i in self.ranking[aciertos]:
+                    if len(lideres) >= top:
+                        return lideres
+                    lideres.append(self.resumen(i))
+            return lideres
+
+    def lista_ganadores(self):
+        with self.lock:
+            return [self.resumen(i) for i in sorted(self.ganadores)]
+
+    def ganadores_pendientes(self):
+        """Cartones que ganaron con las últimas bolas y aún no están en MongoDB."""
+        with self.lock:
+            return [self.cards[i] for i in self.pendientes]
+
+    def confirmar_persistidos(self, cards, version=None):
+        with self.lock:
+            # Guardados mientras la sala cargaba otros cartones: ya no son de este juego
+            if version is not None and version != self.version:
+                return
+            for card in cards:
+                i = self.por_serial[card["serial"]]
+                self.persistidos.add(i)
+                self.pendientes.pop(i, None)
+            # El snapshot recuerda los ganadores guardados: tras un reinicio no se
+            # vuelven a escribir en MongoDB
+            if cards:
+                self.guardar_snapshot()
+
+    def exportar(self, i):
+        """Cartón con el formato del JSON del juego (marks como matriz de bools)."""
+        card = dict(self.cards[i])
+        card["marks"] = mascara_a_marcas(self.motor.mascara(i))
+        card["won"] = i in self.ganadores
+        card["aciertos"] = self.aciertos_cartones[i]
+        return card
+
+    def cartones(self):
+        with self.lock:
+            return [self.exportar(i) for i in range(len(self.cards))]
+
+    def etag(self):
+        """Cambia con el conjunto de cartones (versión) y con cada bola o patrón (seq)."""
+        return f"{self.game_id}-{self.version}-{self.seq}"
+
+    def cartones_json(self):
+        """Cartones serializados para /get_cards; solo se recalcula si hubo bolas nuevas."""
+        with self.lock:
+            etag = self.etag()
+            if self._json_cartones is None or self._json_cartones[0] != etag:
+                self._json_cartones = (etag, json.dumps(self.cartones(), ensure_ascii=False))
+            return self._json_cartones
+
+    def buscar(self, serial):
+        with self.lock:
+            i = self.por_serial.get(serial)
+            return self.exportar(i) if i is not None else None
+
+    # --- Respaldo en disco: registro de bolas + snapshots ---
+    def _registrar(self, datos):
+        self.seq += 1
+        entrada = {"seq": self.seq, **datos, "ts": time.time()}
+        self.historial.append(entrada)
+        if not self.json_path:
+            return
+        try:
+            if self._registro is None:
+                self._registro = open(rutas_respaldo(self.json_path)[0], "a", encoding="utf-8")
+            self._registro.write(json.dumps(entrada) + "\n")
+            self._registro.flush()
+        except Exception as e:
+            print(f"❌ Error al registrar {datos} en {self.json_path}: {e}")
+        if self.seq - self.seq_snapshot >= SNAPSHOT_CADA:
+            self.guardar_snapshot()
+
+    def guardar_snapshot(self):
+        """Marcas de todos los cartones como máscaras de 25 bits, escritas de forma atómica."""
+        with self.lock:
+            if not self.json_path:
+                return
+            snapshot_path = rutas_respaldo(self.json_path)[1]
+            contenido = json.dumps({
+                "seq": self.seq,
+                "json_path": self.json_path,
+                "patron": self.patron,
+                "persistidos": [self.cards[i]["serial"] for i in sorted(self.persistidos)],
+                "mascaras": self.motor.mascaras_todas()
+            })
+            self.seq_snapshot = self.seq
+            self._snapshot_armado += 1
+            generacion = self._snapshot_armado
+        # /mark (cada SNAPSHOT_CADA bolas) y el hilo de GuardadoGanadores escriben a la
+        # vez: un snapshot armado antes no debe pisar a uno posterior ya escrito (con
+        # más bolas o más ganadores guardados en MongoDB)
+        with self._lock_snapshot:
+            if generacion < self._snapshot_escrito:
+                return
+            tmp_path = None
+            try:
+                fd, tmp_path = tempfile.mkstemp(
+                    dir=os.path.dirname(snapshot_path) or ".",
+                    prefix=os.path.basename(snapshot_path) + ".", suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(contenido)
+                os.replace(tmp_path, snapshot_path)
+                self._snapshot_escrito = generacion
+            except Exception as e:
+                print(f"❌ Error al guardar el snapshot {snapshot_path}: {e}")
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def _cerrar_registro(self):
+        if self._registro is not None:
+            try:
+                self._registro.close()
+            except Exception:
+                pass
+            self._registro = None
+
+
+# Bolas entre snapshots del juego (el registro de bolas se escribe en cada una)
+SNAPSHOT_CADA = 10
+
+
+def rutas_respaldo(json_path):
+    """Registro de bolas y snapshot asociados al JSON de un juego."""
+    base = os.path.splitext(json_path)[0]
+    return base + ".bolas.jsonl", base + ".snapshot"
+
+
+def leer_registro_bolas(registro_path):
+    entradas = []
+    if not os.path.exists(registro_path):
+        return entradas
+    validos = 0
+    with open(registro_path, "rb") as f:
+        for linea in f:
+            try:
+                if not linea.endswith(b"\n"):
+                    raise ValueError("línea incompleta")
+                entradas.append(json.loads(linea))
+            except ValueError:
+                # Última línea a medio escribir por una caída: se descarta
+                break
+            validos += len(linea)
+    if validos < os.path.getsize(registro_path):
+        # Se recorta para que las bolas nuevas no queden pegadas a la línea rota
+        with open(registro_path, "r+b") as f:
+            f.truncate(validos)
+    return entradas
+
+
+# ==========================
+# EVENTOS EN VIVO (Server-Sent Events)
+# ==========================
+class PublicadorEventos:
+    """
+    Reparte a cada pantalla conectada a /stream el resumen calculado una sola vez
+    por bola. Cada suscriptor tiene su propia cola; si no la vacía (pestaña
+    colgada), se le descartan eventos en lugar de frenar /mark.
+    """
+
+    def __init__(self, max_pendientes=100):
+        self.lock = threading.Lock()
+        self.suscriptores = []
+        self.max_pendientes = max_pendientes
+
+    def suscribir(self):
+        cola = queue.Queue(maxsize=self.max_pendientes)
+        with self.lock:
+            self.suscriptores.append(cola)
+        return cola
+
+    def desuscribir(self, cola):
+        with self.lock:
+            if cola in self.suscriptores:
+                self.suscriptores.remove(cola)
+
+    def publicar(self, evento):
+        mensaje = f"data: {json.dumps(evento, ensure_ascii=False)}\n\n"
+        with self.lock:
+            suscriptores = list(self.suscriptores)
+        for cola in suscriptores:
+            try:
+                cola.put_nowait(mensaje)
+            except queue.Full:
+                pass
+
+
+# Líderes incluidos en cada evento (los clientes muestran los que necesiten)
+TOP_EVENTOS = 10
+
+
+# ==========================
+# REGISTRO DE JUEGOS (una sesión por sala)
+# ==========================
+class RegistroJuegos:
+    """
+    Juegos simultáneos (salón principal, aulas remotas...) por game_id. Los
+    guardados en disco se restauran una sola vez, en el primer acceso; después
+    cada petición solo busca su juego en el diccionario.
+    """
+
+    def __init__(self, directorio=None, motor=None):
+        self.lock = threading.Lock()
+        self.directorio = directorio
+        self.motor = motor
+        self.juegos = {}
+        self.restaurados = False
+
+    def restaurar_guardados(self):
+        """Reconstruye cada juego desde su JSON más reciente (+ snapshot y registro de bolas)."""
+        with self.lock:
+            if self.restaurados:
+                return
+            self.restaurados = True
+            for game_id, json_path in buscar_jsons_juegos(self.directorio).items():
+                juego = self.juegos.setdefault(game_id, JuegoBingo(self.motor, game_id))
+                try:
+                    juego.restaurar_json(json_path)
+                    print(f"♻️ Juego '{game_id}' restaurado desde {json_path}: {juego.bolas_registradas()} bolas registradas")
+                except Exception as e:
+                    print(f"⚠️ No se pudo restaurar el juego '{game_id}' ({json_path}): {e}")
+
+    def obtener(self, game_id=JUEGO_PRINCIPAL):
+        """Juego existente o None. El principal siempre existe (vacío hasta el primer /reset)."""
+        self.restaurar_guardados()
+        with self.lock:
+            juego = self.juegos.get(game_id)
+            if juego is None and game_id == JUEGO_PRINCIPAL:
+                juego = self.juegos[game_id] = JuegoBingo(self.motor, game_id)
+            return juego
+
+    def crear(self, game_id):
+        """Juego para /reset: se reutiliza el existente para conservar sus pantallas suscritas."""
+        self.restaurar_guardados()
+        with self.lock:
+            juego = self.juegos.get(game_id)
+            if juego is None:
+                juego = self.juegos[game_id] = JuegoBingo(self.motor, game_id)
+            return juego
+
+    def listar(self):
+        self.restaurar_guardados()
+        with self.lock:
+            juegos = list(self.juegos.values())
+        return [juego.info() for juego in juegos]
+
+
+juegos = RegistroJuegos()
+
+
+def leer_game_id():
+    """game_id de la petición (cuerpo JSON o query string); por defecto el juego principal."""
+    data = request.get_json(silent=True) or {}
+    game_id = data.get("game_id") or request.args.get("game_id") or JUEGO_PRINCIPAL
+    return str(game_id)
+
+
+def respuesta_no_modificada(etag):
+    """304 si el cliente ya tiene esta versión (cabecera If-None-Match)."""
+    if request.if_none_match.contains(etag):
+        respuesta = Response(status=304)
+        respuesta.set_etag(etag)
+        return respuesta
+    return None
+
+
+def juego_no_encontrado(game_id):
+    return jsonify({"success": False, "message": f"Juego no encontrado: {game_id}"}), 404
+
+
 # --- Validar y corregir contadores de tablas asignadas ---
 def validar_y_corregir_tablas_usuario(usuario_id):
     """
@@ -451,32 +2082,128 @@ def test_mongo():
 @app.route('/mark', methods=['POST'])
 def mark_number():
     data = request.get_json(silent=True) or {}
-    num = data.get('num')
+    num = safe_int(data.get('num'), None)
     marcado = data.get('marcado', True)
-    files = [f for f in os.listdir(json_dir) if f.endswith('.json')]
-    if not files:
+    # Una bola inválida no debe llegar al registro de bolas ni a las pantallas
+    if num is None or not 1 <= num <= 75:
+        return jsonify({'success': False, 'message': 'num debe ser una bola entre 1 y 75'}), 400
+    game_id = leer_game_id()
+    juego = juegos.obtener(game_id)
+    if juego is None:
+        return juego_no_encontrado(game_id)
+    if not juego.cards:
         return jsonify({'success': False, 'message': 'No hay cartones'}), 400
-    files.sort(reverse=True)
-    path = os.path.join(json_dir, files[0])
-    with open(path, 'r', encoding='utf-8') as f:
-        cards = json.load(f)
-    ganadores = []
-    for card in cards:
-        matrix = card['matrix']
-        marks = card.get('marks', [[False]*5 for _ in range(5)])
-        for r in range(5):
-            for c in range(5):
-                if matrix[r][c] == num:
-                    marks[r][c] = marcado
-        # Centro libre siempre marcado
-        marks[2][2] = True
-        card['marks'] = marks
-        # Validar ganador
-        card['won'] = check_winner_py(marks)
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(cards, f, indent=2, ensure_ascii=False)
+    # Resumen de la bola para las pantallas conectadas a /stream de este juego.
+    # Se arma y publica sin soltar el lock: con /mark concurrentes cada evento
+    # lleva su propio seq y llegan en el orden en que se cantaron las bolas
+    with juego.lock:
+        nuevos_ganadores = juego.marcar(num, marcado)
+        juego.eventos.publicar({
+            "tipo": "bola",
+            "seq": juego.seq,
+            "num": num,
+            "marcado": bool(marcado),
+            "patron": juego.patron,
+            "lideres": juego.lideres(TOP_EVENTOS),
+            "nuevos_ganadores": nuevos_ganadores
+        })
+    guardado_ganadores.avisar(juego)
+    ganadores = [g["serial"] for g in nuevos_ganadores]
     return jsonify({'success': True, 'ganadores': ganadores})
 
+
+def guardar_ganadores_pendientes(juego):
+    """
+    Los ganadores se guardan una sola vez, con la bola (o patrón) que los hizo ganar.
+    Devuelve False si quedaron pendientes porque MongoDB falló.
+    """
+    version = juego.version
+    pendientes = juego.ganadores_pendientes()
+    if not pendientes:
+        return True
+    if not persistir_ganadores(pendientes, juego.patron, juego.game_id):
+        return False
+    juego.confirmar_persistidos(pendientes, version)
+    return True
+
+
+GANADORES_REINTENTO_S = 10
+
+
+class GuardadoGanadores:
+    """
+    Hilo que guarda en MongoDB los ganadores pendientes de cada juego, fuera de
+    /mark y /patron: si la base no responde, cantar bolas no espera su timeout.
+    Los juegos que no se pudieron guardar se reintentan cada `reintento` segundos.
+    """
+
+    def __init__(self, reintento=GANADORES_REINTENTO_S):
+        self.lock = threading.Lock()
+        self.avisados = set()
+        self.hay_trabajo = threading.Event()
+        self.reintento = reintento
+        self.hilo = None
+
+    def avisar(self, juego):
+        with self.lock:
+            self.avisados.add(juego)
+            if self.hilo is None:
+                self.hilo = threading.Thread(target=self._trabajar, name="guardado-ganadores", daemon=True)
+                self.hilo.start()
+        self.hay_trabajo.set()
+
+    def _trabajar(self):
+        espera = None
+        while True:
+            self.hay_trabajo.wait(espera)
+            self.hay_trabajo.clear()
+            with self.lock:
+                juegos_avisados, self.avisados = self.avisados, set()
+            fallidos = set()
+            for juego in juegos_avisados:
+                try:
+                    if not guardar_ganadores_pendientes(juego):
+                        fallidos.add(juego)
+                except Exception as e:
+                    print(f"❌ Error al guardar los ganadores del juego {juego.game_id}: {e}")
+                    fallidos.add(juego)
+            with self.lock:
+                self.avisados |= fallidos
+            espera = self.reintento if fallidos else None
+
+
+guardado_ganadores = GuardadoGanadores()
+
+
+# ENDPOINT PARA CONSULTAR / CAMBIAR EL PATRÓN DE VICTORIA DEL JUEGO
+@app.route('/patron', methods=['GET', 'POST'])
+def patron_juego():
+    game_id = leer_game_id()
+    juego = juegos.obtener(game_id)
+    if juego is None:
+        return juego_no_encontrado(game_id)
+    if request.method == 'GET':
+        return jsonify({"success": True, "patron": juego.patron, "patrones": list(PATRONES)})
+    data = request.get_json(silent=True) or {}
+    patron = data.get('patron')
+    if patron not in PATRONES:
+        return jsonify({
+            "success": False,
+            "message": f"Patrón no válido. Opciones: {', '.join(PATRONES)}"
+        }), 400
+    # Igual que en /mark: el evento se arma bajo el lock del cambio
+    with juego.lock:
+        nuevos_ganadores = juego.cambiar_patron(patron)
+        juego.eventos.publicar({
+            "tipo": "patron",
+            "seq": juego.seq,
+            "patron": patron,
+            "lideres": juego.lideres(TOP_EVENTOS),
+            "nuevos_ganadores": nuevos_ganadores
+        })
+    guardado_ganadores.avisar(juego)
+    return jsonify({"success": True, "patron": patron, "ganadores": juego.lista_ganadores()})
+
 # ENDPOINT PARA RUTAS DE RENDERIZADO
 # @app.route('/')
 # def index():
@@ -489,51 +2216,80 @@ def master_table():
 # ENDPOINT PARA VALIDAR EL PROGRESO DE CADA CARTÓN
 @app.route('/progress', methods=['GET'])
 def progress():
-    cards = get_current_cards()
-    progreso = []
-    for card in cards:
-        aciertos = 0
-        marks = card.get("marks", [[False]*5 for _ in range(5)])
-        matrix = card.get("matrix", [[None]*5 for _ in range(5)])
-        for r in range(5):
-            for c in range(5):
-                # Si la casilla está marcada o es null (libre), cuenta como acierto
-                if marks[r][c] or matrix[r][c] is None:
-                    aciertos += 1
-        card["aciertos"] = aciertos
-        # Solo es ganador si tiene exactamente 25 aciertos (excluyendo el centro libre)
-        card["won"] = (aciertos == 25)
-        ganadores = []
-        if card['won']:
-            ganadores.append(card['serial'])
-            try:
-                # Guardar en MongoDB solo si ganó
-                mongo_collection_winners.update_one(
-                    {"serial": card["serial"]},
-                    {"$set": {
-                        "serial": card["serial"],
-                        "matrix": card["matrix"],
-                        "won": True,
-                        "timestamp": time.time()
-                    }},
-                    upsert=True
-                )
-                print(f"✅ Cartón ganador guardado en MongoDB: {card['serial']}")
-                # 🔄 Actualizar estado 'won' solo si ganó
-                mongo_collection_tables.update_one(
-                    {"serial": card["serial"]},
-                    {"$set": {
-                        "won": True
-                    }}
-                )
-                print(f"🔄 Estado 'won' actualizado en tabla: {card['serial']}")
-            except Exception as e:
-                print(f"❌ Error al guardar el ganador {card['serial']}: {e}")
-        progreso.append({"serial": card["serial"], "aciertos": aciertos, "won": card["won"]})
-    progreso.sort(key=lambda x: x["aciertos"], reverse=True)
-    top3 = progreso[:3]
-    ganadores = [p for p in progreso if p["won"]]
-    return jsonify({"top3": top3, "ganadores": ganadores})
+    top = max(safe_int(request.args.get('top'), 3), 0)
+    game_id = leer_game_id()
+    juego = juegos.obtener(game_id)
+    if juego is None:
+        return juego_no_encontrado(game_id)
+    # Aciertos y ganadores ya se mantienen (y guardan en MongoDB) en cada /mark:
+    # aquí solo se leen. Es ganador el cartón que cumple el patrón activo.
+    with juego.lock:
+        etag = juego.etag()
+        no_modificado = respuesta_no_modificada(etag)
+        if no_modificado:
+            return no_modificado
+        lideres = juego.lideres(top)
+        ganadores = juego.lista_ganadores()
+        patron = juego.patron
+    # "top3" se mantiene por compatibilidad con masterTable.html
+    respuesta = jsonify({"top": lideres, "top3": lideres, "ganadores": ganadores, "patron": patron, "version": juego.version})
+    respuesta.set_etag(etag)
+    return respuesta
+
+# ENDPOINT DE EVENTOS EN VIVO: una conexión por pantalla en lugar de sondear /progress
+@app.route('/stream', methods=['GET'])
+def stream():
+    game_id = leer_game_id()
+    juego = juegos.obtener(game_id)
+    if juego is None:
+        return juego_no_encontrado(game_id)
+    # Estado inicial para que la pantalla no espere a la próxima bola. Se arma al
+    # suscribirse, bajo el lock de /mark: la cola solo recibe bolas posteriores
+    with juego.lock:
+        cola = juego.eventos.suscribir()
+        inicial = {
+            "tipo": "estado",
+            "seq": juego.seq,
+            "patron": juego.patron,
+            "lideres": juego.lideres(TOP_EVENTOS),
+            "ganadores": juego.lista_ganadores()
+        }
+
+    def generar():
+        try:
+            yield f"data: {json.dumps(inicial, ensure_ascii=False)}\n\n"
+            while True:
+                try:
+                    yield cola.get(timeout=15)
+                except queue.Empty:
+                    # Comentario SSE para mantener viva la conexión
+                    yield ": ping\n\n"
+        finally:
+            juego.eventos.desuscribir(cola)
+
+    respuesta = Response(stream_with_context(generar()), mimetype="text/event-stream",
+                         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    # Si la pantalla se desconecta antes del primer evento, generar() no llega a correr
+    respuesta.call_on_close(lambda: juego.eventos.desuscribir(cola))
+    return respuesta
+
+# ENDPOINT: cartones a una bola de ganar con el patrón activo
+@app.route('/casi_ganadores', methods=['GET'])
+def casi_ganadores():
+    game_id = leer_game_id()
+    juego = juegos.obtener(game_id)
+    if juego is None:
+        return juego_no_encontrado(game_id)
+    num = safe_int(request.args.get('num'), None)
+    numeros = juego.casi_ganadores(num)
+    return jsonify({
+        "success": True,
+        "patron": juego.patron,
+        "numeros": numeros,
+        # Cuántos cartones ganarían con cada número
+        "distribucion": {n: len(seriales) for n, seriales in numeros.items()},
+        "total_cartones": len(juego.faltantes)
+    })
 
 # ENDPOINT PARA GENERAR PDF DEL GANADOR
 @app.route('/winner_pdf', methods=['POST'])
@@ -545,8 +2301,11 @@ def winner_pdf():
     if not serial:
         return jsonify({"error": "Faltan datos"}), 400
     if not matrix or not marks:
-        cards = get_current_cards()
-        card = next((c for c in cards if c["serial"] == serial), None)
+        game_id = leer_game_id()
+        juego = juegos.obtener(game_id)
+        if juego is None:
+            return juego_no_encontrado(game_id)
+        card = juego.buscar(serial)
         if not card:
             return jsonify({"error": "Cartón no encontrado"}), 404
         matrix = card["matrix"]
@@ -589,23 +2348,39 @@ def winner_pdf():
     c.save()
     return jsonify({"success": True, "pdf_path": pdf_path, "message": f"PDF ganador guardado en: {pdf_path}"})
 
+# --- Tablas que participan en un juego: asignadas y no ganadoras ---
+def leer_tablas_activas(seriales=None):
+    # Se filtra por "stateAsigned": True para asegurar que solo juegan las tablas asignadas a participantes
+    filtros = [
+        {"$or": [{"won": False}, {"won": {"$exists": False}}]},
+        {"stateAsigned": True}
+    ]
+    if seriales is not None:
+        filtros.append({"serial": {"$in": [str(s) for s in seriales]}})
+    return list(mongo_collection_tables.find(
+        {"$and": filtros},
+        {"serial": 1, "matrix": 1, "stateAsigned": 1}
+    ))
+
 # ENDPOINT PARA REINICIAR EL JUEGO
 @app.route('/reset', methods=['POST'])
 def reset():
+    data = (request.get_json(silent=True) or {}) if has_request_context() else {}
+    game_id = leer_game_id() if has_request_context() else JUEGO_PRINCIPAL
+    if not GAME_ID_VALIDO.match(game_id):
+        return jsonify({"success": False, "message": "game_id no válido (letras, números, '-' o '_', máx. 40)"}), 400
+    # Subconjunto de cartones de la sala (opcional): lista de seriales
+    seriales = data.get("seriales")
+    if seriales is not None and not isinstance(seriales, list):
+        return jsonify({"success": False, "message": "seriales debe ser una lista"}), 400
+    # El patrón de victoria se conserva entre juegos salvo que se pida otro
+    existente = juegos.obtener(game_id)
+    patron = data.get("patron") or (existente.patron if existente is not None else PATRON_POR_DEFECTO)
+    if patron not in PATRONES:
+        return jsonify({"success": False, "message": f"Patrón no válido. Opciones: {', '.join(PATRONES)}"}), 400
     # Reconstruir JSON activo leyendo la colección 'tablas' en MongoDB
     try:
-        # Obtener todas las tablas que NO sean ganadoras y que estén asignadas (solo las que participan en el juego)
-        # Se filtra por "stateAsigned": True para asegurar que solo juegan las tablas asignadas a participantes
-        active_cursor = mongo_collection_tables.find(
-            {
-                "$and": [
-                    {"$or": [{"won": False}, {"won": {"$exists": False}}]},
-                    {"stateAsigned": True}
-                ]
-            },
-            {"serial": 1, "matrix": 1, "stateAsigned": 1}
-        )
-        active_rows = list(active_cursor)
+        active_rows = leer_tablas_activas(seriales)
     except Exception as e:
         return jsonify({"success": False, "message": "Error al leer la base de datos", "error": str(e)}), 500
 
@@ -613,10 +2388,13 @@ def reset():
     if not active_rows:
         # crear un JSON vacío para que el frontend no falle
         os.makedirs(json_dir, exist_ok=True)
-        output_json = os.path.join(json_dir, f"bingo_cards_active_{int(time.time())}.json")
-        with open(output_json, "w", encoding="utf-8") as f:
-            json.dump([], f, indent=2, ensure_ascii=False)
-        return jsonify({"success": True, "message": "No hay cartones activos (todos son ganadores)", "removed_winners": 0, "json_path": output_json})
+        output_json = ruta_json_juego(game_id)
+        version = cache_cartones.guardar(output_json, [])
+        # La sala se registra solo cuando el reinicio ya no puede fallar
+        juego = juegos.crear(game_id)
+        juego.nuevo([], output_json, patron, version)
+        juego.eventos.publicar({"tipo": "reinicio", "active_count": 0, "patron": patron})
+        return jsonify({"success": True, "message": "No hay cartones activos (todos son ganadores)", "removed_winners": 0, "json_path": output_json, "game_id": game_id})
 
     # Construir lista de cartones a partir de la BD
     cards = []
@@ -639,11 +2417,13 @@ def reset():
         card["marks"][2][2] = True
         cards.append(card)
 
-    # Guardar nuevo JSON con timestamp (el frontend elegirá el archivo más reciente)
+    # Guardar nuevo JSON del juego con timestamp (al arrancar se restaura el más reciente)
     os.makedirs(json_dir, exist_ok=True)
-    output_json = os.path.join(json_dir, f"bingo_cards_active_{int(time.time())}.json")
-    with open(output_json, "w", encoding="utf-8") as f:
-        json.dump(cards, f, indent=2, ensure_ascii=False)
+    output_json = ruta_json_juego(game_id)
+    version = cache_cartones.guardar(output_json, cards)
+    juego = juegos.crear(game_id)
+    juego.nuevo(cards, output_json, patron, version)
+    juego.eventos.publicar({"tipo": "reinicio", "active_count": len(cards), "patron": patron})
 
     # Contar ganadores en la colección para información
     try:
@@ -657,117 +2437,97 @@ def reset():
     if removed_winners:
         msg += f" — cartones ganadores detectados en DB: {removed_winners}"
 
-    return jsonify({"success": True, "message": msg, "removed_winners": removed_winners, "json_path": output_json, "active_count": len(cards)})
+    return jsonify({"success": True, "message": msg, "removed_winners": removed_winners, "json_path": output_json, "active_count": len(cards), "patron": patron, "game_id": game_id})
+
+# ENDPOINT: juegos (salas) activos en este proceso
+@app.route('/juegos', methods=['GET'])
+def listar_juegos():
+    return jsonify({"success": True, "juegos": juegos.listar()})
 
 # ENDPOINT PARA GENERAR CARTONES EN PDF
 @app.route('/generate', methods=['POST'])
 def generate_cards():
     data = request.get_json(silent=True) or {}
-    num_cards = safe_int(data.get("num_cards"), 1)
-    PAGE_WIDTH, PAGE_HEIGHT = letter
-    MARGIN_X = 0.5 * inch
-    MARGIN_Y = 0.5 * inch
-    CARD_WIDTH = (PAGE_WIDTH - 2*MARGIN_X) / 2
-    CARD_HEIGHT = (PAGE_HEIGHT - 2*MARGIN_Y) / 2
-    CARDS_PER_PAGE = 4
+    # Como antes de generar por lotes: una cantidad negativa da un lote vacío
+    num_cards = max(safe_int(data.get("num_cards"), 1), 0)
     os.makedirs(upload_dir, exist_ok=True)
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    cards_list = []
-    generated = set()
-
-    for i in range(num_cards):
-        while True:
-            card = generate_bingo_card()
-
-            # Convertir matriz a tupla hashable
-            signature = tuple(tuple(row) for row in card)
-
-            if signature not in generated:
-                generated.add(signature)
-                serial = f"CARD{str(i+1).zfill(5)}"
-                cards_list.append((serial, card))
-                break
+    def firmas_ocupadas(firmas):
+        try:
+            return firmas_en_bd(firmas)
+        except Exception as e:
+            print(f"⚠️ No se pudo comprobar duplicados en MongoDB: {e}")
+            return {}
+
+    # Todos los cartones de una vez, sin duplicados en el lote ni en la base
+    cards_list = [
+        (f"CARD{str(i+1).zfill(5)}", card)
+        for i, card in enumerate(generar_cartones_unicos(num_cards, firmas_ocupadas=firmas_ocupadas))
+    ]
     ##cards_list = [(f"CARD{str(i+1).zfill(5)}", generate_bingo_card()) for i in range(num_cards)]
-    cards_data = []
-    for idx, (serial, card) in enumerate(cards_list):
-        page_pos = idx % CARDS_PER_PAGE
-        row = page_pos // 2
-        col = page_pos % 2
-        x = MARGIN_X + col*CARD_WIDTH
-        y = PAGE_HEIGHT - MARGIN_Y - (row+1)*CARD_HEIGHT
-        # Dibuja el cartón
-        c.setFont("Helvetica-Bold", 14)
-        c.drawCentredString(x + CARD_WIDTH/2, y + CARD_HEIGHT - 15, "BINGO UETS")
-        c.setFont("Helvetica-Bold", 10)
-        c.drawCentredString(x + CARD_WIDTH/2, y + CARD_HEIGHT - 30, serial)
-        grid_top = y + CARD_HEIGHT - 55
-        grid_left = x + 10
-        cell_w = (CARD_WIDTH - 20) / 5
-        cell_h = (CARD_HEIGHT - 60) / 6
-        c.setFont("Helvetica-Bold", 10)
-        for i, L in enumerate(["B","I","N","G","O"]):
-            c.drawCentredString(grid_left + i*cell_w + cell_w/2, grid_top, L)
-        extra_space = 15
-        c.setFont("Helvetica", 8)
-        for r in range(5):
-            for col2 in range(5):
-                left = grid_left + col2*cell_w
-                top = grid_top - extra_space - (r+1)*cell_h
-                c.rect(left, top, cell_w, cell_h)
-                val = card[r][col2]
-                txt = str(val) if val is not None else " "
-                c.drawCentredString(left + cell_w/2, top + cell_h/2 - 3, txt)
-        if page_pos == CARDS_PER_PAGE-1 or idx == len(cards_list)-1:
-            c.showPage()
-        cards_data.append({"serial": serial, "matrix": card})
-    c.save()
-    buffer.seek(0)
+    cards_data = [{"serial": serial, "matrix": card} for serial, card in cards_list]
+    # Dibuja los cartones (en paralelo si son muchos)
     pdf_path = os.path.join(upload_dir, f"bingo_cards_{num_cards}.pdf")
-    with open(pdf_path, "wb") as fpdf:
-        fpdf.write(buffer.getvalue())
+    renderizar_pdf_cartones(cards_list, pdf_path)
     os.makedirs(json_dir, exist_ok=True)
     output_json = os.path.join(json_dir, f"bingo_cards_{num_cards}.json")
-    with open(output_json, "w", encoding="utf-8") as f:
-        json.dump(cards_data, f, indent=2, ensure_ascii=False)
+    cache_cartones.guardar(output_json, cards_data)
+    # Es solo una exportación: ningún juego lee este JSON por la caché
+    cache_cartones.invalidar(output_json)
     
-    # 🔥 Guardar todas las tablas generadas en MongoDB
-    try:
-        for card in cards_data:
-            mongo_collection_tables.update_one(
-                {"serial": card["serial"]},
-                {"$set": {
-                    "serial": card["serial"],
-                    "matrix": card["matrix"],
-                    "timestamp": time.time(),
-                    "won": False,
-                    "stateAsigned": False
-                }},
-                upsert=True
-            )
+    # 🔥 Guardar todas las tablas generadas en MongoDB (por lotes)
+    ahora = time.time()
+    guardado = guardar_tablas_mongo(
+        (card["serial"], {"$set": {
+            "serial": card["serial"],
+            "matrix": card["matrix"],
+            "firma": firma_carton(card["matrix"]),
+            "timestamp": ahora,
+            "won": False,
+            "stateAsigned": False
+        }})
+        for card in cards_data
+    )
+    if guardado["fallidos"]:
+        print(f"❌ {guardado['fallidos']} tablas generadas no se guardaron en MongoDB.")
+    else:
         print(f"✅ Todas las tablas generadas guardadas en MongoDB.")
-    except Exception as e:
-        print(f"❌ Error al guardar las tablas generadas en MongoDB: {e}")
 
     # 🔥 Nuevo: Validar duplicados automáticamente
     validacion = validar_duplicados(cards_data)
 
+    mensaje = f"PDF guardado en: {pdf_path}, JSON en: {output_json}"
+    if guardado["fallidos"]:
+        mensaje = f"❌ {guardado['fallidos']} tablas no se guardaron en MongoDB. {mensaje}"
+
     return jsonify({
-        "success": True,
+        "success": not guardado["fallidos"],
         "pdf_path": pdf_path,
         "json_path": output_json,
         "total_cartones": validacion["total"],
         "cartones_unicos": validacion["unicos"],
         "cartones_duplicados": validacion["duplicados"],
         "duplicados_seriales": validacion["duplicados_seriales"],
-        "message": f"PDF guardado en: {pdf_path}, JSON en: {output_json}"
-    })
+        "insertados_en_mongo": guardado["insertados"],
+        "actualizados_en_mongo": guardado["actualizados"],
+        "fallidos_en_mongo": guardado["fallidos"],
+        "message": mensaje
+    }), 500 if guardado["fallidos"] else 200
 
 # Endpoint para obtener el JSON actual de cartones
 @app.route('/get_cards', methods=['GET'])
 def get_cards():
-    cards = get_current_cards()
-    return jsonify(cards)
+    game_id = leer_game_id()
+    juego = juegos.obtener(game_id)
+    if juego is None:
+        return juego_no_encontrado(game_id)
+    # Si el cliente ya tiene esta versión no hace falta serializar los cartones
+    no_modificado = respuesta_no_modificada(juego.etag())
+    if no_modificado:
+        return no_modificado
+    etag, contenido = juego.cartones_json()
+    respuesta = Response(contenido, mimetype="application/json")
+    respuesta.set_etag(etag)
+    return respuesta
 
 
 # ENDPOINT PARA OBTENER LA/LAS TABLA(S) GANADORA(S) EN JSON
@@ -1436,60 +3196,24 @@ def participante_tablas_pdf(cedula):
 
         tablas_encontradas = list(mongo_collection_tables.find({"_id": {"$in": tablas_ids}}))
 
-        # Generar PDF en memoria
-        buffer = io.BytesIO()
-        c = canvas.Canvas(buffer, pagesize=letter)
-        PAGE_WIDTH, PAGE_HEIGHT = letter
-        MARGIN_X = 0.5 * inch
-        MARGIN_Y = 0.5 * inch
-        CARD_WIDTH = (PAGE_WIDTH - 2*MARGIN_X) / 2
-        CARD_HEIGHT = (PAGE_HEIGHT - 2*MARGIN_Y) / 2
-        CARDS_PER_PAGE = 4
-
-        for idx, tabla in enumerate(tablas_encontradas):
-            matrix = tabla.get("matrix", [[None]*5 for _ in range(5)])
-            serial = tabla.get("serial", "")
-
-            page_pos = idx % CARDS_PER_PAGE
-            row = page_pos // 2
-            col = page_pos % 2
-            x = MARGIN_X + col*CARD_WIDTH
-            y = PAGE_HEIGHT - MARGIN_Y - (row+1)*CARD_HEIGHT
-
-            # Título y serial
-            c.setFont("Helvetica-Bold", 14)
-            c.drawCentredString(x + CARD_WIDTH/2, y + CARD_HEIGHT - 15, "BINGO UETS")
-            c.setFont("Helvetica-Bold", 10)
-            c.drawCentredString(x + CARD_WIDTH/2, y + CARD_HEIGHT - 30, serial)
-
-            grid_top = y + CARD_HEIGHT - 55
-            grid_left = x + 10
-            cell_w = (CARD_WIDTH - 20) / 5
-            cell_h = (CARD_HEIGHT - 60) / 6
-
-            c.setFont("Helvetica-Bold", 10)
-            for i, L in enumerate(["B","I","N","G","O"]):
-                c.drawCentredString(grid_left + i*cell_w + cell_w/2, grid_top, L)
-
-            extra_space = 15
-            c.setFont("Helvetica", 8)
-            for r in range(5):
-                for col2 in range(5):
-                    left = grid_left + col2*cell_w
-                    top = grid_top - extra_space - (r+1)*cell_h
-                    c.rect(left, top, cell_w, cell_h)
-                    val = matrix[r][col2]
-                    txt = str(val) if val is not None else " "
-                    c.drawCentredString(left + cell_w/2, top + cell_h/2 - 3, txt)
-
-            if page_pos == CARDS_PER_PAGE-1 or idx == len(tablas_encontradas)-1:
-                c.showPage()
-
-        c.save()
-        buffer.seek(0)
+        # Generar PDF en un archivo temporal (por partes) y enviarlo desde disco
+        os.makedirs(upload_dir, exist_ok=True)
+        fd, pdf_path = tempfile.mkstemp(prefix="tablas_", suffix=".pdf", dir=upload_dir)
+        os.close(fd)
+        try:
+            renderizar_pdf_cartones([
+                (tabla.get("serial", ""), tabla.get("matrix", [[None]*5 for _ in range(5)]))
+                for tabla in tablas_encontradas
+            ], pdf_path)
+        except Exception:
+            os.remove(pdf_path)
+            raise
 
         filename = f"tablas_{cedula}.pdf"
-        return send_file(buffer, mimetype='application/pdf', as_attachment=True, download_name=filename)
+        respuesta = send_file(pdf_path, mimetype='application/pdf', as_attachment=True, download_name=filename)
+        # El archivo se borra cuando termina de enviarse
+        respuesta.call_on_close(lambda: os.remove(pdf_path))
+        return respuesta
 
     except Exception as e:
         return jsonify({"success": False, "error": str(e), "message": "Error generando PDF de tablas."}), 500
@@ -2699,16 +4423,113 @@ def validar_tabla_serial(serial):
 # -------------------------
 # Endpoint /upload usando la extracción por coordenadas
 # -------------------------
+def procesar_pdf_subido(pdf_path, json_path, procesos=None, lote=MONGO_LOTE_TABLAS, lector=None):
+    """
+    Cadena de generadores de /upload: páginas → cartones → validación → upserts
+    por lotes. Los cartones se escriben en json_path y llegan a MongoDB lote a lote
+    sin juntar la lista completa; solo se recuerda firma y serial de cada uno para
+    detectar repetidos; su registro binario va directo a disco.
+    Devuelve el resumen de la respuesta.
+    """
+    conteo = ConteoDuplicados()
+    # .cartones.npy escrito a la par del JSON; sin NumPy no hay formato binario
+    escritor = EscritorCartonesBinario(json_path) if np is not None else None
+    repetidos_internos = {}
+    duplicados_en_bd = []
+    # firma -> serial de los cartones ya vistos en este PDF o encontrados en la base
+    existentes = {}
+
+    def validados(salida_json):
+        for n, card in enumerate(iterar_cartones_pdf(pdf_path, procesos, lector=lector)):
+            conteo.agregar(card)
+            if escritor is not None:
+                escritor.agregar(card)
+            nums = [num for row in card['matrix'] for num in row if num is not None]
+            if len(nums) != len(set(nums)):
+                repetidos_internos[card['serial']] = {
+                    "nums": nums,
+                    "duplicates": [num for num in set(nums) if nums.count(num) > 1]
+                }
+            salida_json.write(("," if n else "") + "\n  " + json.dumps(card, ensure_ascii=False))
+            yield card
+
+    def cambios_tablas(salida_json):
+        for grupo in en_lotes(validados(salida_json), lote):
+            ahora = time.time()
+            # Cartones que ya existen en la base (o antes en este PDF) con otro serial:
+            # una consulta $in al índice de firmas por lote
+            firmas = [firma_carton(card["matrix"]) for card in grupo]
+            try:
+                existentes.update(firmas_en_bd({f for f in firmas if f is not None and f not in existentes}))
+            except Exception as e:
+                print(f"⚠️ No se pudo comprobar duplicados en MongoDB: {e}")
+            for card, firma in zip(grupo, firmas):
+                campos = {
+                    "serial": card["serial"],
+                    "matrix": card["matrix"],
+                    "timestamp": ahora,
+                    "won": False,
+                    "stateAsigned": False
+                }
+                if firma is not None:
+                    otro = existentes.get(firma)
+                    if otro is not None and otro != card["serial"]:
+                        duplicados_en_bd.append({"serial": card["serial"], "serial_existente": otro})
+                        continue
+                    existentes[firma] = card["serial"]
+                    campos["firma"] = firma
+                    yield card["serial"], {"$set": campos}
+                else:
+                    # Sin firma (matriz incompleta): no participa en el índice único
+                    yield card["serial"], {"$set": campos, "$unset": {"firma": ""}}
+
+    try:
+        with open(json_path, "w", encoding="utf-8") as salida_json:
+            salida_json.write("[")
+            guardado = guardar_tablas_mongo(cambios_tablas(salida_json), lote)
+            salida_json.write("\n]\n")
+    except Exception:
+        if escritor is not None:
+            escritor.valido = False
+            escritor.cerrar()
+        raise
+    # Igual que CacheCartones.guardar: el .cartones.npy queda después del JSON
+    try:
+        if not (escritor is not None and escritor.cerrar()) and os.path.exists(ruta_binaria(json_path)):
+            os.remove(ruta_binaria(json_path))
+    except Exception as e:
+        print(f"⚠️ No se pudo escribir el formato binario de {json_path}: {e}")
+    cache_cartones.invalidar(json_path)
+
+    validacion = conteo.resumen()
+    return {
+        "json_path": json_path,
+        "total_cartones": validacion["total"],
+        "cartones_unicos": validacion["unicos"],
+        "cartones_duplicados": validacion["duplicados"],
+        # Las claves son matrices: se pasan a texto para jsonify
+        "duplicados_seriales": {str(k): v for k, v in validacion["duplicados_seriales"].items()},
+        "repetidos_internos": repetidos_internos,
+        "insertados_en_mongo": guardado["insertados"],
+        "actualizados_en_mongo": guardado["actualizados"],
+        "fallidos_en_mongo": guardado["fallidos"],
+        "duplicados_en_bd": duplicados_en_bd
+    }
+
+
 @app.route('/upload', methods=['POST'])
 def upload_pdf():
     """
-    Sube un PDF, extrae las matrices de bingo, valida duplicados,
-    guarda los cartones en MongoDB y genera un archivo JSON con los resultados.
+    Sube un PDF, extrae las matrices de bingo, valida duplicados, guarda los
+    cartones en MongoDB y en un archivo JSON, y responde con un resumen.
     """
     try:
         file = request.files.get('pdf')
         if not file:
             return jsonify({"error": "No se envió PDF"}), 400
+        lector = request.form.get("lector") or request.args.get("lector")
+        if lector and lector not in LECTORES_PDF:
+            return jsonify({"success": False, "message": f"Lector de PDF no válido. Opciones: {', '.join(LECTORES_PDF)}"}), 400
 
         os.makedirs(json_dir, exist_ok=True)
         os.makedirs(upload_dir, exist_ok=True)
@@ -2721,99 +4542,37 @@ def upload_pdf():
         json_path = os.path.join(json_dir, json_filename)
 
         # ------------------------
-        # 1️⃣ Procesar el PDF
+        # Procesar el PDF por partes: cada lote de cartones se valida y se guarda
+        # en MongoDB mientras se leen las páginas siguientes
         # ------------------------
         try:
-            cards_data = extraer_matrices_pdf(temp_pdf_path, json_path)
+            resumen = procesar_pdf_subido(temp_pdf_path, json_path, lector=lector)
         except Exception as e:
+            return jsonify({"error": "Error al procesar PDF", "detail": str(e)}), 500
+        finally:
             try:
                 os.remove(temp_pdf_path)
             except:
                 pass
-            return jsonify({"error": "Error al procesar PDF", "detail": str(e)}), 500
-
-        try:
-            os.remove(temp_pdf_path)
-        except:
-            pass
-
-        # ------------------------
-        # 2️⃣ Validar duplicados
-        # ------------------------
-        validacion = validar_duplicados(cards_data)
-        repetidos_internos = {}
-
-        for card in cards_data:
-            nums = [n for row in card['matrix'] for n in row if n is not None]
-            if len(nums) != len(set(nums)):
-                repetidos_internos[card['serial']] = {
-                    "nums": nums,
-                    "duplicates": [n for n in set(nums) if nums.count(n) > 1]
-                }
 
         # ------------------------
-        # 3️⃣ Insertar o actualizar en MongoDB
-        # ------------------------
-        insertados = 0
-        actualizados = 0
-
-        for card in cards_data:
-            try:
-                result = mongo_collection_tables.update_one(
-                    {"serial": card["serial"]},
-                    {"$set": {
-                        "serial": card["serial"],
-                        "matrix": card["matrix"],
-                        "timestamp": time.time(),
-                        "won": False,
-                        "stateAsigned": False
-                    }},
-                    upsert=True
-                )
-                if result.upserted_id is not None:
-                    insertados += 1
-                elif result.modified_count > 0:
-                    actualizados += 1
-            except Exception as e:
-                print(f"❌ Error guardando serial {card.get('serial')}: {e}")
-
-        # ------------------------
-        # 4️⃣ Función auxiliar para evitar error JSON
-        # ------------------------
-        def stringify_keys(obj):
-            """Convierte todas las claves no-string en cadenas para evitar TypeError al jsonify."""
-            if isinstance(obj, dict):
-                return {str(k): stringify_keys(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [stringify_keys(i) for i in obj]
-            else:
-                return obj
-
-        cards_data = stringify_keys(cards_data)
-        repetidos_internos = stringify_keys(repetidos_internos)
-        validacion = stringify_keys(validacion)
-
-        # ------------------------
-        # 5️⃣ Guardar JSON final
-        # ------------------------
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(cards_data, f, indent=2, ensure_ascii=False)
-
-        # ------------------------
-        # 6️⃣ Respuesta final
+        # Respuesta: resumen (los cartones quedan en MongoDB y en json_path)
         # ------------------------
+        insertados, actualizados = resumen["insertados_en_mongo"], resumen["actualizados_en_mongo"]
+        fallidos = resumen["fallidos_en_mongo"]
+        duplicados_en_bd = resumen["duplicados_en_bd"]
+        detalle = (f"{insertados} nuevos, {actualizados} actualizados"
+                   f"{f', {len(duplicados_en_bd)} repetidos omitidos' if duplicados_en_bd else ''}")
+        if fallidos:
+            return jsonify({
+                "success": False,
+                **resumen,
+                "message": f"❌ {fallidos} cartones no se guardaron en MongoDB ({detalle})"
+            }), 500
         return jsonify({
             "success": True,
-            "cards": cards_data,
-            "json_path": json_path,
-            "total_cartones": validacion.get("total"),
-            "cartones_unicos": validacion.get("unicos"),
-            "cartones_duplicados": validacion.get("duplicados"),
-            "duplicados_seriales": validacion.get("duplicados_seriales"),
-            "repetidos_internos": repetidos_internos,
-            "insertados_en_mongo": insertados,
-            "actualizados_en_mongo": actualizados,
-            "message": f"✅ Cartones procesados y guardados en MongoDB ({insertados} nuevos, {actualizados} actualizados)"
+            **resumen,
+            "message": f"✅ Cartones procesados y guardados en MongoDB ({detalle})"
         }), 200
 
     except Exception as e:
@@ -2824,13 +4583,164 @@ def upload_pdf():
             "message": "Error inesperado al subir el PDF."
         }), 500
     
+# ==========================
+# SIMULADOR DE PARTIDAS (Monte Carlo)
+# ==========================
+# python app.py simular [partidas] [patron|todos] [cartones.json]
+# Estima cuántas bolas dura una ronda y cuántos ganadores simultáneos salen con
+# los cartones reales. En cada partida la bola en la que se completa cada casilla
+# es su posición en un orden aleatorio de 1..75; un cartón gana cuando la última
+# casilla de alguna máscara del patrón sale, y la ronda termina con el primero.
+SIMULACION_LOTE = 8
+NUNCA = 255  # casilla que no sale en el bombo (número fuera de 1..75)
+_simulacion = {}
+
+
+def numeros_cartones(cards):
+    """(25, N) uint8 con el número de cada casilla; 0 para la casilla libre."""
+    if isinstance(cards, CartonesBinarios):
+        numeros = cards.matrices().T.copy()
+        numeros[numeros > 75] = NUNCA
+        return numeros
+    numeros = np.zeros((25, len(cards)), dtype=np.uint8)
+    for j, card in enumerate(cards):
+        for r, fila in enumerate(card["matrix"]):
+            for c, valor in enumerate(fila):
+                n = safe_int(valor, 0)
+                numeros[r * 5 + c, j] = n if 0 <= n <= 75 else NUNCA
+    # El juego siempre da la casilla central por marcada, traiga o no un número
+    numeros[12, :] = 0
+    return numeros
+
+
+def _iniciar_simulacion(numeros, patrones):
+    _simulacion["numeros"] = numeros
+    _simulacion["patrones"] = {
+        nombre: [[b for b in range(25) if mascara >> b & 1] for mascara in PATRONES[nombre]]
+        for nombre in patrones
+    }
+
+
+def _simular_lote(tarea):
+    semilla, partidas = tarea
+    rng = np.random.default_rng(semilla)
+    numeros = _simulacion["numeros"]
+    resultado = {nombre: [np.zeros(NUNCA + 1, dtype=np.int64), {}] for nombre in _simulacion["patrones"]}
+    bolas = np.arange(1, 76, dtype=np.uint8)
+    for inicio in range(0, partidas, SIMULACION_LOTE):
+        g = min(SIMULACION_LOTE, partidas - inicio)
+        # orden[k] = bola en que sale cada número (0 = casilla libre, NUNCA = no sale)
+        orden = np.full((g, 256), NUNCA, dtype=np.uint8)
+        orden[:, 0] = 0
+        orden[np.arange(g)[:, None], rng.permuted(np.tile(bolas, (g, 1)), axis=1)] = bolas
+        tiempos = np.take(orden, numeros, axis=1)  # (g, 25, N)
+        for nombre, mascaras in _simulacion["patrones"].items():
+            gana = None
+            for celdas in mascaras:
+                t = tiempos[:, celdas, :].max(axis=1)
+                gana = t if gana is None else np.minimum(gana, t)
+            primera = gana.min(axis=1)
+            empates = (gana == primera[:, None]).sum(axis=1)
+            resultado[nombre][0] += np.bincount(primera, minlength=NUNCA + 1)
+            for tamano, veces in zip(*np.unique(empates, return_counts=True)):
+                resultado[nombre][1][int(tamano)] = resultado[nombre][1].get(int(tamano), 0) + int(veces)
+    return resultado
+
+
+def simular_partidas(cards, partidas=10000, patrones=None, procesos=None, semilla=None):
+    """
+    Simula `partidas` órdenes de bolas sobre `cards` repartidas en un pool de procesos.
+    Devuelve por patrón la distribución de la bola del primer ganador y del
+    número de ganadores empatados en esa bola.
+    """
+    if np is None:
+        raise RuntimeError("El simulador necesita NumPy (pip install numpy)")
+    patrones = list(patrones or PATRONES)
+    numeros = numeros_cartones(cards)
+    procesos = procesos or os.cpu_count() or 1
+    # Varios lotes por proceso para repartir bien la carga
+    bloques = max(1, min(partidas, procesos * 4))
+    semillas = np.random.SeedSequence(semilla).generate_state(bloques)
+    tareas = [(int(s), partidas // bloques + (1 if i < partidas % bloques else 0)) for i, s in enumerate(semillas)]
+
+    resultados = []
+    if procesos == 1:
+        _iniciar_simulacion(numeros, patrones)
+        resultados = [_simular_lote(t) for t in tareas]
+    else:
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=CONTEXTO_PROCESOS,
+                                 initializer=_iniciar_simulacion, initargs=(numeros, patrones)) as pool:
+            resultados = list(pool.map(_simular_lote, tareas))
+
+    informe = {}
+    for nombre in patrones:
+        bolas = sum(r[nombre][0] for r in resultados)
+        empates = {}
+        for r in resultados:
+            for tamano, veces in r[nombre][1].items():
+                empates[tamano] = empates.get(tamano, 0) + veces
+        acumulado = np.cumsum(bolas)
+        percentil = lambda q: int(np.searchsorted(acumulado, q * partidas))
+        informe[nombre] = {
+            "partidas": partidas,
+            "bola_media": float((bolas * np.arange(len(bolas))).sum() / partidas),
+            "bola_min": int(np.flatnonzero(bolas)[0]),
+            "bola_p10": percentil(0.10),
+            "bola_p50": percentil(0.50),
+            "bola_p90": percentil(0.90),
+            "bola_max": int(np.flatnonzero(bolas)[-1]),
+            "bolas": {int(b): int(v) for b, v in enumerate(bolas) if v},
+            "empates": dict(sorted(empates.items()))
+        }
+    return informe
+
+
+def simular_cli(args):
+    partidas = safe_int(args[0], 10000) if args else 10000
+    patron = args[1] if len(args) > 1 else "todos"
+    json_path = args[2] if len(args) > 2 else None
+    if partidas < 1:
+        print("El número de partidas debe ser al menos 1.")
+        return
+    if patron != "todos" and patron not in PATRONES:
+        print(f"Patrón no válido. Opciones: todos, {', '.join(PATRONES)}")
+        return
+    if json_path:
+        cards = cache_cartones.leer(json_path)[0]
+    else:
+        cards = leer_tablas_activas()
+    if not cards:
+        print("No hay cartones asignados para simular.")
+        return
+    patrones = list(PATRONES) if patron == "todos" else [patron]
+    print(f"🎲 Simulando {partidas} partidas con {len(cards)} cartones ({', '.join(patrones)})...")
+    inicio = time.time()
+    informe = simular_partidas(cards, partidas, patrones)
+    print(f"⏱️ {time.time() - inicio:.1f} s")
+    for nombre, datos in informe.items():
+        print(f"\n📊 Patrón '{nombre}': primer ganador en la bola "
+              f"{datos['bola_media']:.1f} de media (p10={datos['bola_p10']}, p50={datos['bola_p50']}, "
+              f"p90={datos['bola_p90']}, rango {datos['bola_min']}-{datos['bola_max']})")
+        for tamano in range(1, 6):
+            veces = datos["empates"].get(tamano, 0)
+            print(f"   {tamano} ganador(es) a la vez: {veces / partidas:.1%}")
+        resto = sum(v for t, v in datos["empates"].items() if t > 5)
+        if resto:
+            mayor = max(datos["empates"])
+            print(f"   más de 5 a la vez: {resto / partidas:.1%} (hasta {mayor})")
+
+
 def main():
     if len(sys.argv) > 1:
         arg = sys.argv[1]
-        if arg.endswith('.pdf'):
+        if arg == 'simular':
+            simular_cli(sys.argv[2:])
+        elif arg.endswith('.pdf'):
+            # python app.py cartones.pdf [procesos]
             pdf_path = arg
             output_json = "bingo_cards.json"
-            cards_data = extraer_matrices_pdf(pdf_path, output_json)
+            procesos = safe_int(sys.argv[2], None) if len(sys.argv) > 2 else None
+            cards_data = extraer_matrices_pdf(pdf_path, output_json, procesos)
             validacion = validar_duplicados(cards_data)
             print(f"Se extrajeron {validacion['total']} cartones.")
             print(f"Cartones únicos: {validacion['unicos']}")
@@ -2845,18 +4755,10 @@ def main():
         elif arg.isdigit():
             num_cards = int(arg)
             # --- Generación SIN DUPLICADOS para CLI ---
-            cards_list = []
-            generated = set()
-            for i in range(num_cards):
-                while True:
-                    card = generate_bingo_card()
-                    signature = tuple(tuple(row) for row in card)
-
-                    if signature not in generated:
-                        generated.add(signature)
-                        serial = f"CARD{str(i+1).zfill(5)}"
-                        cards_list.append((serial, card))
-                        break            
+            cards_list = [
+                (f"CARD{str(i+1).zfill(5)}", card)
+                for i, card in enumerate(generar_cartones_unicos(num_cards))
+            ]
             ##cards_list = [(f"CARD{str(i+1).zfill(5)}", generate_bingo_card()) for i in range(num_cards)]
             cards_data = []
             for serial, matrix in cards_list:
@@ -2876,16 +4778,23 @@ def main():
                 print("No se encontraron duplicados.")
             iniciar_bingo(output_json)
         else:
-            print("Argumento no reconocido. Usa un número de tablas o un PDF.")
+            print("Argumento no reconocido. Usa un número de tablas, un PDF o 'simular'.")
     else:
         # Si no hay argumentos, reconstruir el JSON activo (solo tablas asignadas) y luego iniciar el servidor Flask
         try:
-            # Llamar a la función reset() para crear el JSON activo desde la BD
-            # reset() ya filtra por `stateAsigned = True` (ver modificación previa)
-            try:
-                reset()
-            except Exception as e:
-                print(f"Advertencia: fallo al reconstruir JSON inicial desde DB: {e}")
+            # Los juegos que quedaron a medias (con alguna bola cantada) se restauran
+            # desde su snapshot + registro en lugar de reiniciarlos. El registro existe
+            # desde el /reset (patrón inicial), así que eso solo no indica una partida
+            juegos.restaurar_guardados()
+            principal = juegos.obtener(JUEGO_PRINCIPAL)
+            if not principal.en_curso():
+                # Llamar a la función reset() para crear el JSON activo desde la BD
+                # reset() ya filtra por `stateAsigned = True` (ver modificación previa)
+                try:
+                    with app.app_context():
+                        reset()
+                except Exception as e:
+                    print(f"Advertencia: fallo al reconstruir JSON inicial desde DB: {e}")
         finally:
             app.run(host="0.0.0.0", port=5000, debug=True)
 
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""Benchmark del juego: /reset, /mark, /progress, /get_cards y check_winner_py.
+
+Para cada tamaño genera cartones sintéticos, juega las 75 bolas con el cliente
+de pruebas de Flask y mide la latencia de cada llamada (percentiles en ms) y el
+pico de memoria (tracemalloc). El resultado se guarda en JSON para comparar
+versiones.
+
+Uso:
+  python scripts/bench_juego.py
+  python scripts/bench_juego.py --tamanos 1000 10000 --motor numpy --salida bench.json
+
+Si MongoDB responde se usa una base aparte (BINGO_DB=bingo_bench, se borra al
+terminar) y el juego se crea con /reset como en producción. Sin MongoDB el juego
+se carga directamente y los ganadores no se guardan; el JSON lo indica en "mongo".
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from pymongo import MongoClient
+
+MONGO_URI = os.environ.get("BINGO_MONGO_URI", "mongodb://localhost:27017/")
+DB_BENCH = "bingo_bench"
+GAME_ID = "bench"
+
+
+def mongo_disponible():
+    try:
+        MongoClient(MONGO_URI, serverSelectionTimeoutMS=1000).admin.command("ping")
+        return True
+    except Exception:
+        return False
+
+
+def percentiles(tiempos):
+    if not tiempos:
+        return {}
+    ordenados = sorted(tiempos)
+
+    def p(q):
+        return round(ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))], 3)
+
+    return {
+        "n": len(ordenados),
+        "media": round(sum(ordenados) / len(ordenados), 3),
+        "p50": p(0.50),
+        "p90": p(0.90),
+        "p99": p(0.99),
+        "max": round(ordenados[-1], 3)
+    }
+
+
+def cronometrar(funcion, *args, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcion(*args, **kwargs)
+    return resultado, (time.perf_counter() - inicio) * 1000
+
+
+def generar_cartones(app, cantidad, semilla):
+    random.seed(semilla)
+    return [
+        {"serial": f"CARD{str(i + 1).zfill(6)}", "matrix": app.generate_bingo_card()}
+        for i in range(cantidad)
+    ]
+
+
+def crear_juego(app, cliente, cards, patron, con_mongo):
+    """Deja listo el juego GAME_ID y devuelve el tiempo de creación (ms)."""
+    if con_mongo:
+        app.mongo_collection_tables.delete_many({})
+        app.mongo_collection_winners.delete_many({})
+        app.mongo_collection_tables.insert_many([
+            {"serial": c["serial"], "matrix": c["matrix"], "stateAsigned": True, "won": False}
+            for c in cards
+        ])
+        respuesta, ms = cronometrar(cliente.post, "/reset", json={"game_id": GAME_ID, "patron": patron})
+        assert respuesta.status_code == 200, respuesta.get_json()
+        return ms
+
+    # Mismos pasos de /reset sin leer la base
+    def cargar():
+        os.makedirs(app.json_dir, exist_ok=True)
+        json_path = app.ruta_json_juego(GAME_ID)
+        version = app.cache_cartones.guardar(json_path, cards)
+        app.juegos.crear(GAME_ID).nuevo(cards, json_path, patron, version)
+
+    return cronometrar(cargar)[1]
+
+
+def jugar(app, cliente, cards, patron, con_mongo, cada_get_cards, semilla):
+    tiempos = {"mark": [], "progress": [], "progress_304": [], "get_cards": []}
+    tiempos["reset"] = [crear_juego(app, cliente, cards, patron, con_mongo)]
+    consulta = f"?game_id={GAME_ID}"
+    bolas = list(range(1, 76))
+    random.Random(semilla).shuffle(bolas)
+    primer_ganador = None
+    for bola, num in enumerate(bolas, 1):
+        respuesta, ms = cronometrar(cliente.post, "/mark", json={"num": num, "game_id": GAME_ID})
+        tiempos["mark"].append(ms)
+        if primer_ganador is None and respuesta.get_json()["ganadores"]:
+            primer_ganador = bola
+        respuesta, ms = cronometrar(cliente.get, "/progress" + consulta)
+        tiempos["progress"].append(ms)
+        # Pantalla que ya tiene el estado actual: debe salir barato
+        _, ms = cronometrar(cliente.get, "/progress" + consulta,
+                            headers={"If-None-Match": respuesta.headers["ETag"]})
+        tiempos["progress_304"].append(ms)
+        if bola % cada_get_cards == 0:
+            _, ms = cronometrar(cliente.get, "/get_cards" + consulta)
+            tiempos["get_cards"].append(ms)
+    return tiempos, primer_ganador
+
+
+def medir_check_winner_py(app, cliente):
+    """Recorrido completo con la implementación de referencia sobre las marcas finales."""
+    cards = json.loads(cliente.get(f"/get_cards?game_id={GAME_ID}").get_data())
+    _, ms = cronometrar(lambda: [app.check_winner_py(c["marks"]) for c in cards])
+    return ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--motor", choices=["python", "numpy"], default=os.environ.get("BINGO_MOTOR", "python"))
+    parser.add_argument("--patron", default="lleno")
+    parser.add_argument("--cada-get-cards", type=int, default=15, help="llamar a /get_cards cada N bolas")
+    parser.add_argument("--sin-memoria", action="store_true", help="no repetir el juego con tracemalloc")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--salida", default="bench_juego.json")
+    args = parser.parse_args()
+
+    con_mongo = mongo_disponible()
+    salida = os.path.abspath(args.salida)
+    os.environ["BINGO_DB"] = DB_BENCH
+    os.environ["BINGO_MOTOR"] = args.motor
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    # app escribe en ./jsons: se trabaja en un directorio temporal
+    directorio = tempfile.mkdtemp(prefix="bench_juego_")
+    os.chdir(directorio)
+    import app
+
+    if args.patron not in app.PATRONES:
+        parser.error(f"patrón no válido: {', '.join(app.PATRONES)}")
+    if not con_mongo:
+        print("⚠️ MongoDB no responde: el juego se carga sin /reset y los ganadores no se guardan.")
+        app.persistir_ganadores = lambda cards, patron=None, game_id=None: True
+    cliente = app.app.test_client()
+
+    resultados = []
+    try:
+        for cantidad in args.tamanos:
+            print(f"🎲 {cantidad} cartones ({args.motor}, patrón {args.patron})...")
+            cards = generar_cartones(app, cantidad, args.semilla)
+            tiempos, primer_ganador = jugar(app, cliente, cards, args.patron, con_mongo,
+                                            args.cada_get_cards, args.semilla)
+            resultado = {
+                "cartones": cantidad,
+                "primer_ganador_bola": primer_ganador,
+                "check_winner_py_ms": round(medir_check_winner_py(app, cliente), 3)
+            }
+            for nombre, lista in tiempos.items():
+                resultado[f"{nombre}_ms"] = percentiles(lista)
+            if not args.sin_memoria:
+                tracemalloc.start()
+                jugar(app, cliente, cards, args.patron, con_mongo, args.cada_get_cards, args.semilla)
+                resultado["memoria_pico_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+                tracemalloc.stop()
+            resultados.append(resultado)
+            print(f"   /mark p50={resultado['mark_ms']['p50']} ms p99={resultado['mark_ms']['p99']} ms, "
+                  f"/progress p50={resultado['progress_ms']['p50']} ms, "
+                  f"/get_cards p50={resultado['get_cards_ms'].get('p50')} ms, "
+                  f"memoria pico {resultado.get('memoria_pico_mb', '-')} MB")
+    finally:
+        if con_mongo:
+            app.mongo_client.drop_database(DB_BENCH)
+        os.chdir(os.path.dirname(salida))
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    informe = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "motor": args.motor,
+        "patron": args.patron,
+        "mongo": con_mongo,
+        "resultados": resultados
+    }
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"✅ Resultados guardados en {salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Benchmark de la lectura de PDFs de cartones (/upload y `python app.py cartones.pdf`).
+
+Para cada tamaño genera cartones, dibuja el PDF como /generate y mide
+extraer_matrices_pdf leyendo los números de las páginas con cada lector
+(pdfplumber en un solo proceso y con cada número de procesos pedido; PyMuPDF en
+uno), y leyendo el JSON adjunto al PDF.
+Comprueba que todas las variantes devuelven exactamente los cartones dibujados,
+en el mismo orden. El resultado se guarda en JSON para comparar versiones.
+
+Uso:
+  python scripts/bench_pdf.py
+  python scripts/bench_pdf.py --cartones 1000 4000 --procesos 1 2 4 8 --salida bench_pdf.json
+  python scripts/bench_pdf.py --lectores pymupdf --cartones 100000
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+
+def cronometrar(funcion, *args, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcion(*args, **kwargs)
+    return resultado, (time.perf_counter() - inicio) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cartones", type=int, nargs="+", default=[1000, 4000])
+    parser.add_argument("--procesos", type=int, nargs="+", default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument("--lectores", nargs="+", choices=app.LECTORES_PDF, default=list(app.LECTORES_PDF))
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--salida", default="bench_pdf.json")
+    args = parser.parse_args()
+    if app.pymupdf is None and "pymupdf" in args.lectores:
+        print("⚠️ PyMuPDF no está instalado: se mide solo pdfplumber.")
+        args.lectores = [lector for lector in args.lectores if lector != "pymupdf"]
+
+    directorio = tempfile.mkdtemp(prefix="bench_pdf_")
+    resultados = []
+    try:
+        for cantidad in args.cartones:
+            matrices = app.generar_cartones_unicos(cantidad, semilla=args.semilla)
+            cards = [{"serial": f"CARD{str(i + 1).zfill(5)}", "matrix": m} for i, m in enumerate(matrices)]
+            pdf_path = os.path.join(directorio, f"cartones_{cantidad}.pdf")
+            _, ms_pdf = cronometrar(app.renderizar_pdf_cartones, [(c["serial"], c["matrix"]) for c in cards], pdf_path)
+            resultado = {
+                "cartones": cantidad,
+                "paginas": -(-cantidad // app.PDF_CARTONES_POR_PAGINA),
+                "pdf_kb": round(os.path.getsize(pdf_path) / 1024),
+                "renderizar_ms": round(ms_pdf, 1),
+                "extraer": []
+            }
+            print(f"📄 {cantidad} cartones ({resultado['paginas']} páginas)...")
+            for lector in args.lectores:
+                for procesos in (args.procesos if lector == "pdfplumber" else [1]):
+                    leidos, ms = cronometrar(app.extraer_matrices_pdf, pdf_path,
+                                             os.path.join(directorio, "salida.json"), procesos, False, lector)
+                    medida = {"lector": lector, "procesos": procesos, "ms": round(ms, 1), "exactos": leidos == cards}
+                    resultado["extraer"].append(medida)
+                    print(f"   {lector}, {procesos} proceso(s): {ms / 1000:.2f} s, exactos={medida['exactos']}")
+            if app.pymupdf is not None:
+                leidos, ms = cronometrar(lambda ruta: list(app.cartones_adjuntos_pdf(ruta)), pdf_path)
+                resultado["adjunto"] = {"ms": round(ms, 1), "exactos": leidos == cards}
+                print(f"   adjunto JSON: {ms / 1000:.3f} s, exactos={resultado['adjunto']['exactos']}")
+            base = resultado["extraer"][0]["ms"]
+            for medida in resultado["extraer"]:
+                medida["aceleracion"] = round(base / medida["ms"], 2) if medida["ms"] else None
+            resultados.append(resultado)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+    informe = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "nucleos": os.cpu_count(),
+        "lectores": args.lectores,
+        "resultados": resultados
+    }
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"✅ Resultados guardados en {os.path.abspath(args.salida)}")
+
+
+if __name__ == "__main__":
+    main()
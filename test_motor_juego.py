@@ -0,0 +1,597 @@
+"""
+Pruebas del motor del juego en memoria (app.JuegoBingo).
+Comparan la representación por máscaras de bits contra check_winner_py,
+que se mantiene como implementación de referencia.
+"""
+
+import contextlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+import app
+
+
+def generar_cartones(cantidad, semilla=1):
+    random.seed(semilla)
+    return [
+        {"serial": f"CARD{str(i + 1).zfill(5)}", "matrix": app.generate_bingo_card()}
+        for i in range(cantidad)
+    ]
+
+
+def marcar_referencia(cards, num, marcado):
+    """Lógica original de /mark sobre listas anidadas."""
+    for card in cards:
+        marks = card.setdefault("marks", [[False] * 5 for _ in range(5)])
+        for r in range(5):
+            for c in range(5):
+                if card["matrix"][r][c] == num:
+                    marks[r][c] = marcado
+        marks[2][2] = True
+        card["won"] = app.check_winner_py(marks)
+
+
+def aciertos_referencia(card):
+    return sum(
+        1
+        for r in range(5)
+        for c in range(5)
+        if card["marks"][r][c] or card["matrix"][r][c] is None
+    )
+
+
+def casi_ganadores_referencia(cards):
+    """Prueba cada casilla sin marcar de cada cartón no ganador con check_winner_py."""
+    casi = {}
+    for card in cards:
+        if card["won"]:
+            continue
+        for r in range(5):
+            for c in range(5):
+                num = card["matrix"][r][c]
+                if num is None or card["marks"][r][c]:
+                    continue
+                marks = [fila[:] for fila in card["marks"]]
+                marks[r][c] = True
+                if app.check_winner_py(marks):
+                    casi.setdefault(num, []).append(card["serial"])
+    return casi
+
+
+def secuencia_bolas(semilla=2):
+    rnd = random.Random(semilla)
+    bolas = list(range(1, 76))
+    rnd.shuffle(bolas)
+    jugadas = [(n, True) for n in bolas]
+    # Algunas bolas se desmarcan por error del animador
+    for n in rnd.sample(bolas[:40], 6):
+        jugadas.insert(bolas.index(n) + 3, (n, False))
+    return jugadas
+
+
+def test_check_winner_mask_coincide_con_referencia():
+    rnd = random.Random(3)
+    for _ in range(5000):
+        marks = [[rnd.random() < 0.6 for _ in range(5)] for _ in range(5)]
+        mask = app.marcas_a_mascara(marks)
+        assert app.mascara_a_marcas(mask) == marks
+        assert app.check_winner_mask(mask) == app.check_winner_py(marks)
+
+
+def test_patrones_coinciden_con_casillas():
+    rnd = random.Random(4)
+    figuras = {
+        "cuatro_esquinas": [(0, 0), (0, 4), (4, 0), (4, 4)],
+        "x": [(i, i) for i in range(5)] + [(i, 4 - i) for i in range(5)],
+        "l": [(r, 0) for r in range(5)] + [(4, c) for c in range(5)],
+        "lleno": [(r, c) for r in range(5) for c in range(5)],
+    }
+    for _ in range(5000):
+        marks = [[rnd.random() < 0.8 for _ in range(5)] for _ in range(5)]
+        mask = app.marcas_a_mascara(marks)
+        assert app.gana_patron(mask, app.PATRONES["linea"]) == app.check_winner_py(marks)
+        for nombre, celdas in figuras.items():
+            esperado = all(marks[r][c] for r, c in celdas)
+            assert app.gana_patron(mask, app.PATRONES[nombre]) == esperado
+
+
+def test_generacion_por_lotes_sin_repetidos():
+    assert app.generar_cartones_unicos(0) == app.generar_cartones_unicos(-3) == []
+    cards = app.generar_cartones_unicos(3000, semilla=5)
+    assert len({tuple(map(tuple, card)) for card in cards}) == 3000
+    for card in cards:
+        assert card[2][2] is None
+        for col in range(5):
+            columna = [card[r][col] for r in range(5) if (r, col) != (2, 2)]
+            assert len(set(columna)) == len(columna)
+            assert all(1 + 15 * col <= n <= 15 + 15 * col for n in columna)
+
+    if app.np is None:
+        return
+    # Misma firma por cartón que la versión vectorizada
+    firmas = [app.firma_carton(card) for card in cards]
+    matrices = app.np.array([[[n or 0 for n in fila] for fila in card] for card in cards], dtype=app.np.uint8)
+    assert [f.tobytes() for f in app.firmas_cartones(matrices)] == firmas
+
+    # Con la misma semilla, las firmas "ya en la base" obligan a rehacer todos los cartones
+    consultas = []
+
+    def ocupadas(lote):
+        consultas.append(len(lote))
+        return set(firmas)
+
+    nuevos = app.generar_cartones_unicos(3000, semilla=5, firmas_ocupadas=ocupadas)
+    assert len(nuevos) == 3000
+    assert not set(firmas) & {app.firma_carton(card) for card in nuevos}
+    assert consultas[0] == 3000
+
+
+def test_firmas_antiguas_se_completan_por_lotes():
+    """Las tablas sin firma se completan en bulk_write de MONGO_LOTE_TABLAS operaciones."""
+    matrices = app.generar_cartones_unicos(25, semilla=6)
+
+    class Coleccion:
+        def __init__(self):
+            self.lotes = []
+
+        def create_index(self, *args, **kwargs):
+            pass
+
+        def find(self, filtro, proyeccion):
+            for i, matrix in enumerate(matrices):
+                yield {"_id": i, "matrix": matrix}
+
+        def bulk_write(self, operaciones, ordered=True):
+            self.lotes.append(len(operaciones))
+            return type("Resultado", (), {"modified_count": len(operaciones)})()
+
+    coleccion = Coleccion()
+    originales = app.mongo_collection_tables, app.MONGO_LOTE_TABLAS, app._indice_firmas_listo
+    app.mongo_collection_tables, app.MONGO_LOTE_TABLAS, app._indice_firmas_listo = coleccion, 10, False
+    try:
+        app.asegurar_indice_firmas()
+    finally:
+        app.mongo_collection_tables, app.MONGO_LOTE_TABLAS, app._indice_firmas_listo = originales
+    assert coleccion.lotes == [10, 10, 5]
+
+
+def comprobar_motor(motor):
+    cards = generar_cartones(300)
+    referencia = [dict(c) for c in cards]
+    juego = app.JuegoBingo(motor=motor)
+    # Con el patrón "linea" el motor debe coincidir con check_winner_py
+    juego.cargar([dict(c) for c in cards], patron="linea")
+    assert juego.motor.nombre == motor
+
+    for num, marcado in secuencia_bolas():
+        juego.marcar(num, marcado)
+        marcar_referencia(referencia, num, marcado)
+        exportados = juego.cartones()
+        assert juego.aciertos_todos() == [aciertos_referencia(c) for c in referencia]
+        for i, card in enumerate(referencia):
+            assert exportados[i]["marks"] == card["marks"]
+            assert exportados[i]["won"] == card["won"]
+            assert juego.aciertos(i) == aciertos_referencia(card)
+
+        # Ranking incremental: mismos aciertos que ordenar todo
+        ordenados = sorted((aciertos_referencia(c) for c in referencia), reverse=True)
+        assert [l["aciertos"] for l in juego.lideres(10)] == ordenados[:10]
+        ganadores = [c["serial"] for c in referencia if c["won"]]
+        assert [g["serial"] for g in juego.lista_ganadores()] == ganadores
+
+        # Índice "a una bola" mantenido en cada marca
+        casi = {n: sorted(s) for n, s in juego.casi_ganadores().items()}
+        assert casi == {n: sorted(s) for n, s in casi_ganadores_referencia(referencia).items()}
+
+        # Cada ganador queda pendiente de guardar una sola vez
+        pendientes = juego.ganadores_pendientes()
+        assert all(c["serial"] in ganadores for c in pendientes)
+        juego.confirmar_persistidos(pendientes)
+        assert juego.ganadores_pendientes() == []
+
+        # Cartón lleno: ganador solo con los 25 aciertos
+        juego.cambiar_patron("lleno")
+        ganadores = [c["serial"] for c in referencia if aciertos_referencia(c) == 25]
+        assert [g["serial"] for g in juego.lista_ganadores()] == ganadores
+        juego.cambiar_patron("linea")
+
+
+def test_motor_python_coincide_con_referencia():
+    comprobar_motor("python")
+
+
+def test_motor_numpy_coincide_con_referencia():
+    if app.np is None:
+        return
+    comprobar_motor("numpy")
+
+
+def test_juegos_independientes_y_restaurados():
+    cards = generar_cartones(40)
+    with tempfile.TemporaryDirectory() as directorio:
+        registro = app.RegistroJuegos(directorio)
+        for game_id, sala in (("principal", cards[:25]), ("aula1", cards[25:])):
+            json_path = os.path.join(directorio, f"bingo_cards_active_{game_id}_100.json")
+            with open(json_path, "w", encoding="utf-8") as f:
+                json.dump(sala, f)
+            registro.crear(game_id).nuevo([dict(c) for c in sala], json_path, "linea")
+
+        principal, aula = registro.obtener("principal"), registro.obtener("aula1")
+        assert registro.obtener("aula2") is None
+        for num, marcado in secuencia_bolas()[:30]:
+            principal.marcar(num, marcado)
+        assert aula.seq == 1 and aula.aciertos_todos() == [1] * 15
+        assert [c["serial"] for c in aula.cartones()] == [c["serial"] for c in cards[25:]]
+
+        # Al arrancar de nuevo cada sala se reconstruye desde su propio registro
+        restaurado = app.RegistroJuegos(directorio)
+        assert sorted(j["game_id"] for j in restaurado.listar()) == ["aula1", "principal"]
+        assert restaurado.obtener("principal").cartones() == principal.cartones()
+        assert restaurado.obtener("aula1").seq == 1
+        for juego in (principal, aula, restaurado.obtener("principal"), restaurado.obtener("aula1")):
+            juego._cerrar_registro()
+
+
+def test_juego_sin_bolas_no_esta_en_curso():
+    """El patrón inicial que registra nuevo() no cuenta como partida a medias al arrancar."""
+    cards = generar_cartones(10)
+    with tempfile.TemporaryDirectory() as directorio:
+        json_path = os.path.join(directorio, "bingo_cards_active_principal_100.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(cards, f)
+        juego = app.RegistroJuegos(directorio).crear("principal")
+        juego.nuevo([dict(c) for c in cards], json_path, "linea")
+        restaurado = app.RegistroJuegos(directorio).obtener("principal")
+        assert not juego.en_curso() and not restaurado.en_curso()
+        assert restaurado.bolas_registradas() == 0 and restaurado.patron == "linea"
+
+        juego.marcar(secuencia_bolas()[0][0])
+        restaurado = app.RegistroJuegos(directorio).obtener("principal")
+        assert restaurado.en_curso() and restaurado.bolas_registradas() == 1
+        for j in (juego, restaurado):
+            j._cerrar_registro()
+
+
+def test_ganadores_guardados_no_se_repiten_tras_reinicio():
+    cards = generar_cartones(30)
+    with tempfile.TemporaryDirectory() as directorio:
+        json_path = os.path.join(directorio, "bingo_cards_active_principal_100.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(cards, f)
+        juego = app.RegistroJuegos(directorio).crear("principal")
+        juego.nuevo([dict(c) for c in cards], json_path, "linea")
+        for num, marcado in secuencia_bolas():
+            juego.marcar(num, marcado)
+            if juego.ganadores_pendientes():
+                break
+        pendientes = juego.ganadores_pendientes()
+        assert pendientes
+        juego.confirmar_persistidos(pendientes)
+
+        restaurado = app.RegistroJuegos(directorio).obtener("principal")
+        assert restaurado.lista_ganadores() == juego.lista_ganadores()
+        assert restaurado.ganadores_pendientes() == []
+        for j in (juego, restaurado):
+            j._cerrar_registro()
+
+
+def test_snapshots_concurrentes_conservan_ganadores_guardados():
+    """/mark y el hilo que guarda ganadores escriben el snapshot a la vez sin pisarse."""
+    cards = generar_cartones(30)
+    with tempfile.TemporaryDirectory() as directorio:
+        json_path = os.path.join(directorio, "bingo_cards_active_principal_100.json")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(cards, f)
+        juego = app.RegistroJuegos(directorio).crear("principal")
+        juego.nuevo([dict(c) for c in cards], json_path, "linea")
+        for num, marcado in secuencia_bolas():
+            juego.marcar(num, marcado)
+            if juego.ganadores_pendientes():
+                break
+        pendientes = juego.ganadores_pendientes()
+
+        hilos = [threading.Thread(target=juego.guardar_snapshot) for _ in range(8)]
+        hilos.append(threading.Thread(target=juego.confirmar_persistidos, args=(pendientes,)))
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        assert not [n for n in os.listdir(directorio) if n.endswith(".tmp")]
+        with open(app.rutas_respaldo(json_path)[1], encoding="utf-8") as f:
+            snapshot = json.load(f)
+        assert snapshot["persistidos"] == [c["serial"] for c in pendientes]
+        juego._cerrar_registro()
+
+
+@contextlib.contextmanager
+def sala_de_prueba(cards, patron="lleno", game_id="prueba"):
+    """Registro de juegos temporal con una sala cargada, para llamar a los endpoints sin MongoDB."""
+    with tempfile.TemporaryDirectory() as directorio:
+        registro, app.juegos = app.juegos, app.RegistroJuegos(directorio)
+        # /reset escribe el JSON del juego en json_dir: no dejarlo en ./jsons
+        json_dir, app.json_dir = app.json_dir, directorio
+        juego = app.juegos.crear(game_id)
+        try:
+            json_path = os.path.join(directorio, f"bingo_cards_active_{game_id}_100.json")
+            version = app.cache_cartones.guardar(json_path, cards)
+            juego.nuevo([dict(c) for c in cards], json_path, patron, version)
+            yield juego, app.app.test_client()
+        finally:
+            juego._cerrar_registro()
+            app.juegos = registro
+            app.json_dir = json_dir
+
+
+def test_mark_rechaza_bolas_invalidas():
+    with sala_de_prueba(generar_cartones(20)) as (juego, cliente):
+        seq = juego.seq
+        for num in (None, "x", 0, 76):
+            respuesta = cliente.post("/mark", json={"num": num, "game_id": "prueba"})
+            assert respuesta.status_code == 400
+        # Nada llega al registro de bolas
+        assert juego.seq == seq
+        assert app.leer_registro_bolas(app.rutas_respaldo(juego.json_path)[0])[-1]["seq"] == seq
+        assert cliente.post("/mark", json={"num": 7, "game_id": "prueba"}).status_code == 200
+        assert juego.seq == seq + 1
+
+
+def test_mark_no_espera_a_mongodb():
+    """Con MongoDB sin responder, /mark contesta al momento y los ganadores se guardan después."""
+    responde = threading.Event()
+    guardados = []
+
+    def persistir(cards, patron=None, game_id=None):
+        if not responde.wait(5):
+            return False
+        guardados.extend(c["serial"] for c in cards)
+        return True
+
+    with sala_de_prueba(generar_cartones(30), patron="linea") as (juego, cliente):
+        persistir_original, guardado_original = app.persistir_ganadores, app.guardado_ganadores
+        app.persistir_ganadores, app.guardado_ganadores = persistir, app.GuardadoGanadores(reintento=0.05)
+        try:
+            for num, marcado in secuencia_bolas():
+                inicio = time.time()
+                respuesta = cliente.post("/mark", json={"num": num, "marcado": marcado, "game_id": "prueba"})
+                assert respuesta.status_code == 200 and time.time() - inicio < 1
+                if respuesta.get_json()["ganadores"]:
+                    break
+            ganadores = [g["serial"] for g in juego.lista_ganadores()]
+            assert [c["serial"] for c in juego.ganadores_pendientes()] == ganadores
+            responde.set()
+            for _ in range(100):
+                if not juego.ganadores_pendientes():
+                    break
+                time.sleep(0.05)
+            assert guardados == ganadores and juego.ganadores_pendientes() == []
+        finally:
+            app.persistir_ganadores, app.guardado_ganadores = persistir_original, guardado_original
+
+
+def test_stream_publica_bolas_y_reinicios():
+    cards = generar_cartones(30)
+    with sala_de_prueba(cards, patron="linea") as (juego, cliente):
+        cola = juego.eventos.suscribir()
+        leer_original = app.leer_tablas_activas
+        try:
+            for num, marcado in secuencia_bolas():
+                cliente.post("/mark", json={"num": num, "marcado": marcado, "game_id": "prueba"})
+                evento = json.loads(cola.get_nowait()[len("data: "):])
+                assert cola.empty()
+                assert evento["tipo"] == "bola" and evento["num"] == num and evento["seq"] == juego.seq
+                if evento["nuevos_ganadores"]:
+                    break
+            assert evento["nuevos_ganadores"] == juego.lista_ganadores()
+
+            # Sin tablas activas en la base, /reset no necesita MongoDB
+            app.leer_tablas_activas = lambda seriales=None: []
+            assert cliente.post("/reset", json={"game_id": "prueba"}).status_code == 200
+            evento = json.loads(cola.get_nowait()[len("data: "):])
+            assert cola.empty()
+            assert evento == {"tipo": "reinicio", "active_count": 0, "patron": "linea"}
+        finally:
+            app.leer_tablas_activas = leer_original
+            juego.eventos.desuscribir(cola)
+
+
+def test_stream_empieza_con_el_estado_y_sigue_con_las_bolas():
+    with sala_de_prueba(generar_cartones(20)) as (juego, cliente):
+        (num, _), (otra, _) = secuencia_bolas()[:2]
+        cliente.post("/mark", json={"num": num, "game_id": "prueba"})
+        respuesta = cliente.get("/stream?game_id=prueba", buffered=False)
+        eventos = iter(respuesta.response)
+        inicial = json.loads(next(eventos)[len("data: "):])
+        assert inicial["tipo"] == "estado" and inicial["seq"] == juego.seq
+        assert inicial["lideres"] == juego.lideres(app.TOP_EVENTOS)
+
+        cliente.post("/mark", json={"num": otra, "game_id": "prueba"})
+        evento = json.loads(next(eventos)[len("data: "):])
+        assert evento["tipo"] == "bola" and evento["num"] == otra and evento["seq"] == inicial["seq"] + 1
+        respuesta.close()
+        assert juego.eventos.suscriptores == []
+
+
+def test_generate_con_cantidad_negativa_da_lote_vacio():
+    with sala_de_prueba([]) as (juego, cliente):
+        upload_dir, app.upload_dir = app.upload_dir, os.path.dirname(juego.json_path)
+        try:
+            respuesta = cliente.post("/generate", json={"num_cards": -3})
+        finally:
+            app.upload_dir = upload_dir
+        assert respuesta.status_code == 200
+        assert respuesta.get_json()["total_cartones"] == 0
+
+
+def test_reset_fallido_no_crea_sala():
+    with sala_de_prueba(generar_cartones(5)) as (_, cliente):
+        respuesta = cliente.post("/reset", json={"game_id": "aula9", "patron": "zigzag"})
+        assert respuesta.status_code == 400
+        assert [j["game_id"] for j in cliente.get("/juegos").get_json()["juegos"]] == ["prueba"]
+
+
+def test_etag_de_cartones_y_progreso():
+    cards = generar_cartones(20)
+    with sala_de_prueba(cards) as (juego, cliente):
+        for ruta in ("/get_cards?game_id=prueba", "/progress?game_id=prueba"):
+            respuesta = cliente.get(ruta)
+            etag = respuesta.headers["ETag"]
+            assert respuesta.status_code == 200
+            no_modificada = cliente.get(ruta, headers={"If-None-Match": etag})
+            assert no_modificada.status_code == 304 and no_modificada.data == b""
+            # Cada bola cambia el ETag y el cliente vuelve a recibir los datos
+            cliente.post("/mark", json={"num": secuencia_bolas()[0][0], "game_id": "prueba"})
+            otra = cliente.get(ruta, headers={"If-None-Match": etag})
+            assert otra.status_code == 200 and otra.headers["ETag"] != etag
+
+        # Con el ETag vigente no se vuelven a serializar los cartones
+        etag = cliente.get("/get_cards?game_id=prueba").headers["ETag"]
+        juego._json_cartones = None
+        assert cliente.get("/get_cards?game_id=prueba", headers={"If-None-Match": etag}).status_code == 304
+        assert juego._json_cartones is None
+
+        # Tras reiniciar (caché vacía) el mismo JSON da la misma versión...
+        app.cache_cartones.invalidar()
+        assert app.cache_cartones.leer(juego.json_path)[1] == juego.version
+        # ...y otros cartones en la misma sala no reutilizan un ETag ya entregado
+        otro_json = os.path.join(os.path.dirname(juego.json_path), "bingo_cards_active_prueba_200.json")
+        with open(otro_json, "w", encoding="utf-8") as f:
+            json.dump(cards[:10], f)
+        otro_cards, version = app.cache_cartones.leer(otro_json)
+        otro = app.JuegoBingo(game_id="prueba")
+        otro.cargar(otro_cards, otro_json, patron="lleno", version=version)
+        otro.seq = juego.seq
+        assert otro.etag() != etag
+
+
+def test_formato_binario_equivale_al_json():
+    if app.np is None:
+        return
+    cards = generar_cartones(120)
+    with tempfile.TemporaryDirectory() as directorio:
+        json_path = os.path.join(directorio, "bingo_cards_active_principal_1.json")
+        app.cache_cartones.guardar(json_path, cards)
+        binarios, _ = app.CacheCartones().leer(json_path)
+        assert isinstance(binarios, app.CartonesBinarios)
+        assert list(binarios) == cards
+        for motor in ("python", "numpy"):
+            desde_json, desde_binario = app.JuegoBingo(motor=motor), app.JuegoBingo(motor=motor)
+            desde_json.cargar([dict(c) for c in cards], patron="linea")
+            desde_binario.cargar(binarios, patron="linea")
+            for num, marcado in secuencia_bolas()[:40]:
+                assert desde_json.marcar(num, marcado) == desde_binario.marcar(num, marcado)
+            assert desde_json.cartones() == desde_binario.cartones()
+            assert desde_binario.buscar(cards[7]["serial"])["matrix"] == cards[7]["matrix"]
+
+
+def test_simulador_coincide_con_el_juego():
+    if app.np is None:
+        return
+    cards = generar_cartones(200)
+    # Un número en la casilla central no cambia nada: el juego la da por marcada
+    con_centro = [{"serial": c["serial"], "matrix": [list(fila) for fila in c["matrix"]]} for c in cards[:5]]
+    for c in con_centro:
+        c["matrix"][2][2] = 40
+    assert (app.numeros_cartones(con_centro) == app.numeros_cartones(cards[:5])).all()
+    app._iniciar_simulacion(app.numeros_cartones(cards), list(app.PATRONES))
+    bolas = app.np.arange(1, 76, dtype=app.np.uint8)
+    for semilla in range(10):
+        resultado = app._simular_lote((semilla, 1))
+        # Mismo orden de bolas que genera el simulador para una partida
+        orden = app.np.random.default_rng(semilla).permuted(app.np.tile(bolas, (1, 1)), axis=1)[0]
+        for patron in app.PATRONES:
+            juego = app.JuegoBingo()
+            juego.cargar([dict(c) for c in cards], patron=patron)
+            for bola, num in enumerate(orden, 1):
+                if juego.marcar(int(num)):
+                    break
+            assert resultado[patron][0][bola] == 1
+            assert resultado[patron][1] == {len(juego.ganadores): 1}
+
+
+def test_pdf_generado_se_lee_igual():
+    # 10 cartones: la última página queda con dos posiciones vacías
+    cards = generar_cartones(10)
+    with tempfile.TemporaryDirectory() as directorio:
+        pdf_path = os.path.join(directorio, "cartones.pdf")
+        app.renderizar_pdf_cartones([(c["serial"], c["matrix"]) for c in cards], pdf_path)
+        json_path = os.path.join(directorio, "cartones.json")
+        # Leyendo los números por su posición en la página
+        assert app.extraer_matrices_pdf(pdf_path, json_path, procesos=1, usar_adjunto=False) == cards
+        # Repartido entre procesos con una página por tramo (algún proceso lee varios
+        # tramos): mismo resultado y orden
+        minimo, app.PDF_MIN_PAGINAS_PARALELO = app.PDF_MIN_PAGINAS_PARALELO, 1
+        por_tramo, app.PDF_PAGINAS_POR_TRAMO = app.PDF_PAGINAS_POR_TRAMO, 1
+        try:
+            assert app.extraer_matrices_pdf(pdf_path, json_path, procesos=2, usar_adjunto=False) == cards
+        finally:
+            app.PDF_MIN_PAGINAS_PARALELO = minimo
+            app.PDF_PAGINAS_POR_TRAMO = por_tramo
+        # Un proceso que recibe un tramo anterior al último leído vuelve al principio del PDF
+        app._abrir_pdf_extraccion(pdf_path)
+        try:
+            por_pagina = app.PDF_CARTONES_POR_PAGINA
+            for inicio in (2, 0, 1):
+                assert app._extraer_paginas((inicio, inicio + 1)) == cards[inicio * por_pagina:(inicio + 1) * por_pagina]
+        finally:
+            app._pdf_extraccion.pop("pdf").close()
+            app._pdf_extraccion.clear()
+        # /upload sin MongoDB: el JSON escrito por partes queda con su .cartones.npy
+        guardar, firmas = app.guardar_tablas_mongo, app.firmas_en_bd
+        app.guardar_tablas_mongo = lambda cambios, lote: {"insertados": len(list(cambios)), "actualizados": 0, "fallidos": 0}
+        app.firmas_en_bd = lambda firmas: {}
+        try:
+            subido = os.path.join(directorio, "subido.json")
+            resumen = app.procesar_pdf_subido(pdf_path, subido, procesos=1)
+        finally:
+            app.guardar_tablas_mongo, app.firmas_en_bd = guardar, firmas
+        assert resumen["insertados_en_mongo"] == len(cards)
+        with open(subido, "r", encoding="utf-8") as f:
+            assert json.load(f) == cards
+        # El archivo crudo de registros no queda en disco
+        assert not [n for n in os.listdir(directorio) if n.endswith((".crudo", ".tmp"))]
+        leidos, _ = app.cache_cartones.leer(subido)
+        if app.np is not None:
+            assert isinstance(leidos, app.CartonesBinarios)
+        assert [dict(c) for c in leidos] == cards
+        # Con PyMuPDF: mismas palabras por posición y cartones adjuntos al PDF
+        if app.pymupdf is not None:
+            assert app.extraer_matrices_pdf(pdf_path, json_path, usar_adjunto=False, lector="pymupdf") == cards
+            assert list(app.cartones_adjuntos_pdf(pdf_path)) == cards
+            assert app.extraer_matrices_pdf(pdf_path, json_path) == cards
+            # Dibujado en varias partes unidas al archivo una a una: mismas páginas y adjuntos
+            por_parte, app.PDF_CARTONES_POR_PARTE = app.PDF_CARTONES_POR_PARTE, app.PDF_CARTONES_POR_PAGINA
+            try:
+                app.renderizar_pdf_cartones([(c["serial"], c["matrix"]) for c in cards], pdf_path, procesos=1)
+            finally:
+                app.PDF_CARTONES_POR_PARTE = por_parte
+            assert list(app.cartones_adjuntos_pdf(pdf_path)) == cards
+            assert app.extraer_matrices_pdf(pdf_path, json_path, procesos=1, usar_adjunto=False) == cards
+
+
+if __name__ == "__main__":
+    test_check_winner_mask_coincide_con_referencia()
+    test_patrones_coinciden_con_casillas()
+    test_generacion_por_lotes_sin_repetidos()
+    test_firmas_antiguas_se_completan_por_lotes()
+    test_motor_python_coincide_con_referencia()
+    test_motor_numpy_coincide_con_referencia()
+    test_juegos_independientes_y_restaurados()
+    test_juego_sin_bolas_no_esta_en_curso()
+    test_ganadores_guardados_no_se_repiten_tras_reinicio()
+    test_snapshots_concurrentes_conservan_ganadores_guardados()
+    test_mark_rechaza_bolas_invalidas()
+    test_mark_no_espera_a_mongodb()
+    test_stream_publica_bolas_y_reinicios()
+    test_stream_empieza_con_el_estado_y_sigue_con_las_bolas()
+    test_generate_con_cantidad_negativa_da_lote_vacio()
+    test_reset_fallido_no_crea_sala()
+    test_etag_de_cartones_y_progreso()
+    test_formato_binario_equivale_al_json()
+    test_simulador_coincide_con_el_juego()
+    test_pdf_generado_se_lee_igual()
+    print("✅ Motor del juego coincide con la referencia")